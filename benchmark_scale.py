@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cost of each high-DPI tile strategy
+
+Runs fully offline against locally drawn stand-in tiles, so the timings
+cover stitching and resampling only; the tile and byte columns show what
+each strategy would cost against a real tile provider.
+"""
+
+import time
+
+from hidpi import render_region, tile_count
+from tiles import TILE_SIZE, stand_in_fetch
+
+# Tokyo at zoom 12, same framing as the 800x600 maps in generate_osm_maps.py
+ZOOM = 12
+LEFT, TOP = 931000, 412000
+WIDTH, HEIGHT = 800, 600
+RETINA_URL = "https://tiles.example.com/{z}/{x}/{y}{r}.png"
+PLAIN_URL = "https://tiles.example.com/{z}/{x}/{y}.png"
+# Rough size of a compressed 256x256 street map tile
+BYTES_PER_TILE_PIXEL = 25_000 / (TILE_SIZE * TILE_SIZE)
+
+def run(scale, tile_url, repeat=5):
+    """Render the benchmark region and return (plan, tiles fetched, seconds per render)"""
+    fetched = []
+
+    def counting_factory(url, tile_scale):
+        fetch = stand_in_fetch(url, tile_scale)
+
+        def counted(zoom, x, y):
+            fetched.append((zoom, x, y))
+            return fetch(zoom, x, y)
+        return counted
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        image, plan = render_region(ZOOM, LEFT, TOP, WIDTH, HEIGHT, scale=scale, tile_url=tile_url,
+                                    fetch_factory=counting_factory)
+    elapsed = (time.perf_counter() - start) / repeat
+    assert image.size == (WIDTH * scale, HEIGHT * scale)
+    return plan, len(fetched) // repeat, elapsed
+
+if __name__ == '__main__':
+    print(f"{WIDTH}x{HEIGHT} map at zoom {ZOOM}")
+    print(f"{'scale':>5}  {'strategy':<9} {'zoom':>4} {'tiles':>5} {'bound':>5} "
+          f"{'MPix fetched':>12} {'~MB transfer':>12} {'ms/render':>9}")
+    for scale in (1, 2, 3):
+        for tile_url in (RETINA_URL, PLAIN_URL):
+            plan, tiles, seconds = run(scale, tile_url)
+            pixels = tiles * (TILE_SIZE * plan.tile_scale) ** 2
+            print(f"{scale:>5}  {plan.strategy:<9} {plan.zoom:>4} {tiles:>5} "
+                  f"{tile_count(plan, WIDTH, HEIGHT):>5} {pixels / 1e6:>12.1f} "
+                  f"{pixels * BYTES_PER_TILE_PIXEL / 1e6:>12.2f} {seconds * 1000:>9.1f}")
+            if scale == 1:
+                # Both templates behave identically at scale 1
+                break
@@ -0,0 +1,173 @@
+"""
+Aggregate points into polygons to drive choropleth maps
+
+Points are processed in fixed-size chunks so memory stays flat however many
+there are. Within a chunk, points are bucketed into a uniform grid (the
+spatial index); each polygon only looks at the grid rows and columns its
+bounding box covers, and those candidates go through a vectorized even-odd
+point-in-polygon test. The per-polygon counts, sums or means then feed a
+classed colour scale.
+"""
+
+import numpy as np
+
+STATISTICS = ('count', 'sum', 'mean')
+NO_DATA_COLOR = '#cccccc'
+
+def _as_rings(polygon):
+    """A polygon is one (N, 2) ring of (lon, lat) or a list of rings (outer ring plus holes)"""
+    try:
+        ring = np.asarray(polygon, dtype=float)
+    except ValueError:
+        # Ragged list of rings
+        ring = None
+    if ring is not None and ring.ndim == 2 and ring.shape[1] == 2:
+        return [ring]
+    return [np.asarray(r, dtype=float) for r in polygon]
+
+class PolygonLayer:
+    """Polygons flattened into edge arrays, with a bounding box per polygon"""
+
+    def __init__(self, polygons, names=None):
+        self.names = list(names) if names is not None else [str(i) for i in range(len(polygons))]
+        self.edges = []
+        bboxes = []
+        for polygon in polygons:
+            rings = _as_rings(polygon)
+            starts = np.concatenate([ring for ring in rings])
+            # Each ring is closed implicitly: every vertex connects to the next, the last to the first
+            ends = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings])
+            keep = np.any(starts != ends, axis=1)
+            self.edges.append((starts[keep, 0], starts[keep, 1], ends[keep, 0], ends[keep, 1]))
+            bboxes.append((starts[:, 0].min(), starts[:, 1].min(), starts[:, 0].max(), starts[:, 1].max()))
+        self.bboxes = np.array(bboxes, dtype=float).reshape(-1, 4)
+
+    def __len__(self):
+        return len(self.edges)
+
+def points_in_polygon(px, py, edges):
+    """Even-odd test of many points against one polygon's edges, vectorized over the points"""
+    inside = np.zeros(px.shape, dtype=bool)
+    for x1, y1, x2, y2 in zip(*edges):
+        if y1 == y2:
+            # Horizontal edges never cross a horizontal ray
+            continue
+        crosses = (y1 > py) != (y2 > py)
+        x_cross = x1 + (py - y1) * ((x2 - x1) / (y2 - y1))
+        inside ^= crosses & (px < x_cross)
+    return inside
+
+class _PointGrid:
+    """Points of one chunk bucketed into a uniform grid, sorted by cell"""
+
+    def __init__(self, lons, lats, bounds, cells_per_side):
+        self.x0, self.y0, x1, y1 = bounds
+        self.n = cells_per_side
+        self.cell_w = max(x1 - self.x0, 1e-12) / self.n
+        self.cell_h = max(y1 - self.y0, 1e-12) / self.n
+        col = np.clip(((lons - self.x0) / self.cell_w).astype(np.int64), 0, self.n - 1)
+        row = np.clip(((lats - self.y0) / self.cell_h).astype(np.int64), 0, self.n - 1)
+        cells = row * self.n + col
+        self.order = np.argsort(cells, kind='stable')
+        self.sorted_cells = cells[self.order]
+
+    def candidates(self, bbox):
+        """Indices of the points in the grid cells overlapping bbox"""
+        c0 = int(np.clip((bbox[0] - self.x0) // self.cell_w, 0, self.n - 1))
+        c1 = int(np.clip((bbox[2] - self.x0) // self.cell_w, 0, self.n - 1))
+        r0 = int(np.clip((bbox[1] - self.y0) // self.cell_h, 0, self.n - 1))
+        r1 = int(np.clip((bbox[3] - self.y0) // self.cell_h, 0, self.n - 1))
+        # Cells of one grid row are contiguous in the sorted order
+        rows = np.arange(r0, r1 + 1) * self.n
+        lo = np.searchsorted(self.sorted_cells, rows + c0, side='left')
+        hi = np.searchsorted(self.sorted_cells, rows + c1, side='right')
+        if len(lo) == 1:
+            return self.order[lo[0]:hi[0]]
+        return np.concatenate([self.order[a:b] for a, b in zip(lo, hi)])
+
+def _chunks(lons, lats, values, chunk_size):
+    for start in range(0, len(lons), chunk_size):
+        stop = start + chunk_size
+        chunk_values = None if values is None else np.asarray(values[start:stop], dtype=float)
+        yield (np.asarray(lons[start:stop], dtype=float), np.asarray(lats[start:stop], dtype=float),
+               chunk_values)
+
+def assign_chunk(layer, lons, lats, cells_per_side=64):
+    """Index of the polygon containing each point, or -1; the first matching polygon wins"""
+    assigned = np.full(len(lons), -1, dtype=np.int64)
+    if len(lons) == 0 or len(layer) == 0:
+        return assigned
+    bounds = (layer.bboxes[:, 0].min(), layer.bboxes[:, 1].min(),
+              layer.bboxes[:, 2].max(), layer.bboxes[:, 3].max())
+    grid = _PointGrid(lons, lats, bounds, cells_per_side)
+    for i, bbox in enumerate(layer.bboxes):
+        candidates = grid.candidates(bbox)
+        if len(candidates) == 0:
+            continue
+        px, py = lons[candidates], lats[candidates]
+        # Exact bounding-box filter before the edge test
+        in_box = (px >= bbox[0]) & (px <= bbox[2]) & (py >= bbox[1]) & (py <= bbox[3])
+        in_box &= assigned[candidates] < 0
+        candidates, px, py = candidates[in_box], px[in_box], py[in_box]
+        if len(candidates):
+            assigned[candidates[points_in_polygon(px, py, layer.edges[i])]] = i
+    return assigned
+
+def assign_points(layer, lons, lats, chunk_size=1_000_000):
+    """Polygon index for every point (-1 outside all polygons), computed chunk by chunk"""
+    return np.concatenate([assign_chunk(layer, x, y) for x, y, _ in _chunks(lons, lats, None, chunk_size)]
+                          or [np.empty(0, dtype=np.int64)])
+
+def aggregate(layer, lons, lats, values=None, stat='count', chunk_size=1_000_000):
+    """Per-polygon count, sum or mean of the points that fall inside each polygon
+
+    lons/lats/values may be NumPy arrays or memory-mapped arrays; only one
+    chunk is converted and processed at a time. Polygons with no points get
+    NaN for 'mean'.
+    """
+    if stat not in STATISTICS:
+        raise ValueError(f"Unknown stat {stat!r}, expected one of {STATISTICS}")
+    if stat != 'count' and values is None:
+        raise ValueError(f"stat {stat!r} needs values")
+    counts = np.zeros(len(layer), dtype=np.int64)
+    sums = np.zeros(len(layer), dtype=float)
+    for x, y, v in _chunks(lons, lats, values, chunk_size):
+        assigned = assign_chunk(layer, x, y)
+        hit = assigned >= 0
+        counts += np.bincount(assigned[hit], minlength=len(layer))
+        if v is not None:
+            sums += np.bincount(assigned[hit], weights=v[hit], minlength=len(layer))
+    if stat == 'count':
+        return counts
+    if stat == 'sum':
+        return sums
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+def classify(values, k=5, method='quantile'):
+    """Split values into k classes; returns (breaks, class index per value, -1 for NaN)"""
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return np.array([]), np.full(len(values), -1)
+    if method == 'quantile':
+        breaks = np.quantile(values[valid], np.linspace(0, 1, k + 1))
+    elif method == 'equal_interval':
+        breaks = np.linspace(values[valid].min(), values[valid].max(), k + 1)
+    else:
+        raise ValueError(f"Unknown method {method!r}, expected 'quantile' or 'equal_interval'")
+    breaks = np.unique(breaks)
+    if len(breaks) == 1:
+        # All values are equal: one class [v, v], so len(breaks) - 1 still counts the classes
+        breaks = np.repeat(breaks, 2)
+    classes = np.full(len(values), -1)
+    # Upper break is inclusive for the last class
+    classes[valid] = np.clip(np.searchsorted(breaks, values[valid], side='right') - 1, 0, len(breaks) - 2)
+    return breaks, classes
+
+def class_colors(classes, n_classes, cmap='YlOrRd'):
+    """Hex colour for each class index from a matplotlib colormap (NO_DATA_COLOR for -1)"""
+    from matplotlib import colormaps
+    from matplotlib.colors import to_hex
+    colormap = colormaps[cmap].resampled(max(n_classes, 1))
+    return [to_hex(colormap(c)) if c >= 0 else NO_DATA_COLOR for c in classes]
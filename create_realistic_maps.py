@@ -3,7 +3,6 @@
 Create realistic-looking map images using matplotlib
 """
 
-import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 from matplotlib.patches import Circle, Rectangle, Polygon
 import numpy as np
@@ -11,9 +10,17 @@ from PIL import Image, ImageDraw, ImageFont
 import os
 import japanize_matplotlib  # 日本語フォントサポート
 
+from figure_pool import FigurePool
+from choropleth import PolygonLayer, aggregate, classify, class_colors
+from geodesy import cumulative_lengths, polygon_area, format_distance, format_area
+from feature_store import FeatureStore
+
 # Create images directory if it doesn't exist
 os.makedirs('images', exist_ok=True)
 
+# Figures are reused between maps of the same size and drawn directly through Agg
+FIGURE_POOL = FigurePool(dpi=100, facecolor='white')
+
 def create_map_background(ax, extent=None):
     """Create a map-like background with coastlines and grid"""
     if extent is None:
@@ -125,16 +132,35 @@ def create_tokyo_street_map(ax):
     ax.fill_between(river_x, river_y - 0.005, river_y + 0.005, 
                     color='#87CEEB', alpha=0.7, edgecolor='#4682B4')
 
+def add_measured_line(ax, lons, lats, color='g'):
+    """Draw a measurement line and label it with its geodesic length"""
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    ax.plot(lons, lats, f'{color}-', linewidth=2)
+    ax.plot(lons, lats, f'{color}o', markersize=8)
+    # Put the label halfway along the line, just above it
+    along = cumulative_lengths(lats, lons)
+    mid_lon = np.interp(along[-1] / 2, along, lons)
+    mid_lat = np.interp(along[-1] / 2, along, lats)
+    y_min, y_max = ax.get_ylim()
+    ax.text(mid_lon, mid_lat + 0.012 * (y_max - y_min), format_distance(along[-1]), ha='center', va='bottom',
+            bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
+
+def add_measured_polygon(ax, points, **style):
+    """Draw a polygon and label it with its geodesic area"""
+    ax.add_patch(Polygon(points, **style))
+    lons, lats = np.asarray(points, dtype=float).T
+    ax.text(lons.mean(), lats.mean(), format_area(polygon_area(lats, lons)), ha='center', va='center',
+            bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
+
 def save_map(fig, filename, title):
     """Save map with title"""
-    plt.title(title, fontsize=16, pad=20)
-    plt.tight_layout()
-    plt.savefig(f'images/{filename}', dpi=100, bbox_inches='tight', facecolor='white')
-    plt.close()
+    fig.axes[0].set_title(title, fontsize=16, pad=20)
+    FIGURE_POOL.save(fig, f'images/{filename}')
     print(f"Created: images/{filename}")
 
 # 1. Basic Map (World view)
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 create_map_background(ax)
 ax.plot(0, 30, 'bo', markersize=8)
 ax.set_xlabel('Longitude')
@@ -142,7 +168,7 @@ ax.set_ylabel('Latitude')
 save_map(fig, 'basic_map.png', 'Basic Interactive Map')
 
 # 2. Tokyo centered map
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 create_tokyo_street_map(ax)
 ax.plot(139.6503, 35.6762, 'ro', markersize=12)
 ax.set_xlabel('Longitude')
@@ -150,21 +176,21 @@ ax.set_ylabel('Latitude')
 save_map(fig, 'tokyo_map.png', 'Map Centered on Tokyo')
 
 # 3. Sized map
-fig, ax = plt.subplots(1, 1, figsize=(8, 5))
+fig, ax = FIGURE_POOL.acquire((8, 5))
 create_tokyo_street_map(ax)
 ax.set_xlabel('Longitude')
 ax.set_ylabel('Latitude')
 save_map(fig, 'sized_map.png', 'Map with Custom Size')
 
 # 4. OpenStreetMap basemap
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 create_tokyo_street_map(ax)
 ax.set_xlabel('Longitude')
 ax.set_ylabel('Latitude')
 save_map(fig, 'osm_basemap.png', 'OpenStreetMap Basemap')
 
 # 5. Multiple basemaps
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 create_tokyo_street_map(ax)
 # Add some styling to simulate different basemap
 ax.set_facecolor('#e8e8e8')
@@ -173,7 +199,7 @@ ax.set_ylabel('Latitude')
 save_map(fig, 'multiple_basemaps.png', 'Multiple Basemaps')
 
 # 6. Custom tile layer (London)
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 ax.set_xlim(-0.3, 0.05)
 ax.set_ylim(51.4, 51.6)
 ax.grid(True, alpha=0.3, linestyle='--')
@@ -188,7 +214,7 @@ ax.set_ylabel('Latitude')
 save_map(fig, 'custom_tile_layer.png', 'Custom Tile Layer')
 
 # 7. Map with markers
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 create_tokyo_street_map(ax)
 # Tokyo Station
 ax.plot(139.6503, 35.6762, 'ro', markersize=10, label='東京駅')
@@ -202,7 +228,7 @@ ax.set_ylabel('Latitude')
 save_map(fig, 'markers_map.png', 'Map with Markers')
 
 # 8. GeoJSON data (New York)
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 ax.set_xlim(-74.1, -73.9)
 ax.set_ylim(40.65, 40.8)
 ax.grid(True, alpha=0.3, linestyle='--')
@@ -216,14 +242,14 @@ ax.set_ylabel('Latitude')
 save_map(fig, 'geojson_data.png', 'GeoJSON Data Visualization')
 
 # 9. Shapefile data (World)
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 create_map_background(ax)
 ax.set_xlabel('Longitude')
 ax.set_ylabel('Latitude')
 save_map(fig, 'shapefile_data.png', 'Shapefile Data Visualization')
 
 # 10. Raster data (Mt. Fuji area - use contours)
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 ax.set_xlim(138, 139)
 ax.set_ylim(35.5, 36.5)
 # Create elevation-like data
@@ -233,50 +259,43 @@ X, Y = np.meshgrid(x, y)
 # Simulate Mt. Fuji elevation
 Z = 3000 * np.exp(-((X-138.5)**2 + (Y-36.0)**2)*10)
 contour = ax.contourf(X, Y, Z, levels=10, cmap='terrain')
-plt.colorbar(contour, ax=ax, label='Elevation (m)')
+fig.colorbar(contour, ax=ax, label='Elevation (m)')
 ax.set_xlabel('Longitude')
 ax.set_ylabel('Latitude')
 save_map(fig, 'raster_data.png', 'Raster Data Visualization')
 
 # 11. Draw tool
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 create_tokyo_street_map(ax)
-# Add drawn polygon
-polygon = Polygon([(139.64, 35.67), (139.66, 35.68), (139.67, 35.67), (139.65, 35.66)], 
-                 facecolor='blue', alpha=0.3, edgecolor='blue', linewidth=2)
-ax.add_patch(polygon)
+# Add drawn polygon, labelled with its area
+add_measured_polygon(ax, [(139.64, 35.67), (139.66, 35.68), (139.67, 35.67), (139.65, 35.66)],
+                     facecolor='blue', alpha=0.3, edgecolor='blue', linewidth=2)
 ax.set_xlabel('Longitude')
 ax.set_ylabel('Latitude')
 save_map(fig, 'draw_tool.png', 'Drawing Tool Interface')
 
 # 12. Measure tool
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 create_tokyo_street_map(ax)
-# Add measurement line
-ax.plot([139.6403, 139.6603], [35.6762, 35.6762], 'g-', linewidth=2)
-ax.plot([139.6403, 139.6603], [35.6762, 35.6762], 'go', markersize=8)
-# Add distance label
-ax.text(139.6503, 35.678, '2.2 km', ha='center', va='bottom', 
-        bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
+# Add measurement line, labelled with its measured distance
+add_measured_line(ax, [139.6403, 139.6603], [35.6762, 35.6762])
 ax.set_xlabel('Longitude')
 ax.set_ylabel('Latitude')
 save_map(fig, 'measure_tool.png', 'Measurement Tool Interface')
 
 # 13. Split map
-fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 6))
+fig, (ax1, ax2) = FIGURE_POOL.acquire((12, 6), ncols=2)
 create_tokyo_street_map(ax1)
 ax1.set_title('Terrain View')
 create_tokyo_street_map(ax2)
 ax2.set_facecolor('#e8e8e8')
 ax2.set_title('Satellite View')
-plt.suptitle('Split Screen Map', fontsize=16, y=1.02)
-plt.tight_layout()
-plt.savefig('images/split_map.png', dpi=100, bbox_inches='tight', facecolor='white')
-plt.close()
+fig.suptitle('Split Screen Map', fontsize=16, y=1.02)
+FIGURE_POOL.save(fig, 'images/split_map.png')
 print("Created: images/split_map.png")
 
 # 14. Time slider
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 create_tokyo_street_map(ax)
 # Add time indicator
 ax.text(0.5, 0.02, 'Time: 2024-01-01 12:00', transform=ax.transAxes, 
@@ -286,10 +305,10 @@ ax.set_ylabel('Latitude')
 save_map(fig, 'time_slider.png', 'Time Slider Interface')
 
 # 15. Japan cities map
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 create_japan_background(ax)
 # Add major cities
-cities = {
+cities = FeatureStore.from_mapping({
     '東京': (139.6503, 35.6762),
     '大阪': (135.5023, 34.6937),
     '名古屋': (136.9066, 35.1815),
@@ -298,35 +317,52 @@ cities = {
     '仙台': (140.8694, 38.2682),
     '広島': (132.4553, 34.3853),
     '京都': (135.7681, 35.0116)
-}
-for city, (lon, lat) in cities.items():
-    ax.plot(lon, lat, 'ro', markersize=8)
+})
+ax.plot(cities.lons, cities.lats, 'ro', markersize=8, linestyle='none')
+for city, lon, lat in zip(cities.labels(), cities.lons.tolist(), cities.lats.tolist()):
     ax.text(lon, lat + 0.5, city, ha='center', va='bottom', fontsize=10)
 ax.set_xlabel('Longitude')
 ax.set_ylabel('Latitude')
 save_map(fig, 'japan_cities_map.png', 'Major Cities of Japan')
 
 # 16. Choropleth map (Europe)
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 ax.set_xlim(-10, 30)
 ax.set_ylim(35, 60)
 ax.grid(True, alpha=0.3, linestyle='--')
 ax.set_facecolor('#c6e2ff')
 # European countries (simplified)
-countries = [
-    Polygon([(-10, 36), (-6, 42), (0, 43), (0, 36)], facecolor='#ff9999'),  # Spain
-    Polygon([(0, 42), (8, 45), (8, 36), (0, 36)], facecolor='#99ff99'),     # France
-    Polygon([(7, 47), (15, 47), (15, 42), (7, 42)], facecolor='#9999ff'),   # Italy
-    Polygon([(5, 52), (15, 52), (15, 47), (5, 47)], facecolor='#ffff99'),   # Germany
-]
-for country in countries:
-    ax.add_patch(country)
+countries = {
+    'Spain': [(-10, 36), (-6, 42), (0, 43), (0, 36)],
+    'France': [(0, 42), (8, 45), (8, 36), (0, 36)],
+    'Italy': [(7, 47), (15, 47), (15, 42), (7, 42)],
+    'Germany': [(5, 52), (15, 52), (15, 47), (5, 47)],
+}
+# Simulated observations clustered around the capitals, counted per country
+rng = np.random.default_rng(7)
+capitals = np.array([(-3.70, 40.42), (2.35, 48.86), (12.50, 41.90), (13.40, 52.52)])
+weights = np.array([0.2, 0.3, 0.15, 0.35])
+n_points = 500_000
+centers = capitals[rng.choice(len(capitals), n_points, p=weights)]
+point_lons = centers[:, 0] + rng.normal(0, 3.0, n_points)
+point_lats = centers[:, 1] + rng.normal(0, 2.0, n_points)
+layer = PolygonLayer(list(countries.values()), names=list(countries))
+counts = aggregate(layer, point_lons, point_lats, stat='count')
+breaks, classes = classify(counts, k=4, method='quantile')
+n_classes = len(breaks) - 1
+palette = class_colors(range(n_classes), n_classes, cmap='YlOrRd')
+for ring, c in zip(countries.values(), classes):
+    ax.add_patch(Polygon(ring, facecolor=palette[c], edgecolor='#666666', linewidth=1))
+ax.legend(handles=[patches.Patch(facecolor=palette[c], edgecolor='#666666',
+                                 label=f'{breaks[c]:,.0f} - {breaks[c + 1]:,.0f}')
+                   for c in range(n_classes)],
+          title='Observations', loc='upper left')
 ax.set_xlabel('Longitude')
 ax.set_ylabel('Latitude')
 save_map(fig, 'choropleth_map.png', 'Choropleth Map')
 
 # 17. Heatmap
-fig, ax = plt.subplots(1, 1, figsize=(8, 6))
+fig, ax = FIGURE_POOL.acquire((8, 6))
 create_tokyo_street_map(ax)
 # Generate heatmap data
 np.random.seed(42)
@@ -337,7 +373,7 @@ y = np.random.normal(35.6762, 0.05, n_points)
 heatmap, xedges, yedges = np.histogram2d(x, y, bins=20, range=[[139.5, 139.8], [35.6, 35.75]])
 extent = [xedges[0], xedges[-1], yedges[0], yedges[-1]]
 im = ax.imshow(heatmap.T, extent=extent, origin='lower', cmap='hot', alpha=0.6, aspect='auto')
-plt.colorbar(im, ax=ax, label='Density')
+fig.colorbar(im, ax=ax, label='Density')
 ax.set_xlabel('Longitude')
 ax.set_ylabel('Latitude')
 save_map(fig, 'heatmap.png', 'Heat Map Visualization')
@@ -1,13 +1,24 @@
 #!/usr/bin/env python3
 """
 Create sample placeholder images for Leafmap tutorial
+
+The border, grid, coastline arcs, title bar and logo are identical for every
+image, so they are drawn once into a template; each output is a copy of the
+template with only its title and markers drawn on top. Images are rendered
+across a process pool.
+
+    python create_sample_images.py                  # placeholder images
+    python create_sample_images.py --thumbnails     # thumbnails of images/*.png
 """
 
-from PIL import Image, ImageDraw, ImageFont
+import argparse
+import glob
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
 
-# Create images directory if it doesn't exist
-os.makedirs('images', exist_ok=True)
+FONT_REGULAR = "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf"
 
 # Define image information
 images = [
@@ -30,62 +41,144 @@ images = [
     ('heatmap.png', 'ヒートマップ', 'Heat map visualization'),
 ]
 
-# Create each image
-for filename, title_jp, title_en in images:
+# Thumbnail widths, largest first; each level is reduced from the one before
+THUMBNAIL_WIDTHS = (400, 200, 100)
+
+@lru_cache(maxsize=None)
+def load_font(path, size):
+    """Load a TrueType font once per process, falling back to the default font"""
+    try:
+        return ImageFont.truetype(path, size)
+    except OSError:
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=1)
+def render_template():
+    """Draw everything the placeholder images have in common"""
     # Create a new image with light gray background
     img = Image.new('RGB', (800, 600), color='#f0f0f0')
     draw = ImageDraw.Draw(img)
-    
+
     # Draw a border
     draw.rectangle([10, 10, 790, 590], outline='#333333', width=2)
-    
+
     # Draw a map-like background
     # Draw grid lines
     for x in range(50, 750, 50):
         draw.line([(x, 50), (x, 550)], fill='#cccccc', width=1)
     for y in range(50, 550, 50):
         draw.line([(50, y), (750, y)], fill='#cccccc', width=1)
-    
+
     # Add some map-like elements
     # Draw a "coastline"
     draw.arc([100, 150, 300, 350], 0, 180, fill='#0066cc', width=3)
     draw.arc([400, 200, 600, 400], 45, 225, fill='#0066cc', width=3)
-    
+
+    font_subtitle = load_font(FONT_REGULAR, 24)
+
+    # Draw title background
+    draw.rectangle([0, 0, 800, 100], fill='#333333')
+
+    # Add Leafmap logo placeholder
+    draw.rectangle([720, 520, 780, 580], fill='#4CAF50', outline='#2E7D32', width=2)
+    lm_bbox = draw.textbbox((0, 0), 'LM', font=font_subtitle)
+    lm_width = lm_bbox[2] - lm_bbox[0]
+    lm_height = lm_bbox[3] - lm_bbox[1]
+    draw.text((750 - lm_width//2, 550 - lm_height//2), 'LM', fill='white', font=font_subtitle)
+
+    return img
+
+def create_sample_image(filename, title_en, output_dir='images'):
+    """Copy the template and draw the per-image title and markers"""
+    img = render_template().copy()
+    draw = ImageDraw.Draw(img)
+
     # Add some "markers" for maps that should have them
     if 'marker' in filename or 'cities' in filename:
         marker_positions = [(200, 250), (350, 300), (500, 280), (550, 350)]
         for pos in marker_positions:
             draw.ellipse([pos[0]-10, pos[1]-10, pos[0]+10, pos[1]+10], fill='#ff0000', outline='#800000')
-    
-    # Add text
-    try:
-        # Try to use a better font if available
-        font_title = ImageFont.truetype("/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf", 36)
-        font_subtitle = ImageFont.truetype("/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf", 24)
-    except:
-        # Fall back to default font
-        font_title = ImageFont.load_default()
-        font_subtitle = ImageFont.load_default()
-    
-    # Draw title background
-    draw.rectangle([0, 0, 800, 100], fill='#333333')
-    
+
     # Draw titles (use simple text without anchor for compatibility)
     # English subtitle only (to avoid Japanese encoding issues)
+    font_subtitle = load_font(FONT_REGULAR, 24)
     text_bbox = draw.textbbox((0, 0), title_en, font=font_subtitle)
     text_width = text_bbox[2] - text_bbox[0]
     text_height = text_bbox[3] - text_bbox[1]
     draw.text((400 - text_width//2, 50 - text_height//2), title_en, fill='white', font=font_subtitle)
-    
-    # Add Leafmap logo placeholder
-    draw.rectangle([720, 520, 780, 580], fill='#4CAF50', outline='#2E7D32', width=2)
-    lm_bbox = draw.textbbox((0, 0), 'LM', font=font_subtitle)
-    lm_width = lm_bbox[2] - lm_bbox[0]
-    lm_height = lm_bbox[3] - lm_bbox[1]
-    draw.text((750 - lm_width//2, 550 - lm_height//2), 'LM', fill='white', font=font_subtitle)
-    
+
     # Save the image
-    img.save(f'images/{filename}')
-    print(f'Created: images/{filename}')
+    path = os.path.join(output_dir, filename)
+    img.save(path)
+    return path
+
+def _create_sample_image(job):
+    return create_sample_image(*job)
+
+def create_sample_images(entries=images, output_dir='images', workers=None):
+    """Render (filename, title_jp, title_en) entries across a process pool"""
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(filename, title_en, output_dir) for filename, _, title_en in entries]
+    workers = workers or os.cpu_count() or 1
+    # Large chunks keep per-task IPC small for big catalogs
+    chunksize = max(1, len(jobs) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path in executor.map(_create_sample_image, jobs, chunksize=chunksize):
+            print(f'Created: {path}')
+
+def create_thumbnails(path, output_dir, widths=THUMBNAIL_WIDTHS):
+    """Write a pyramid of thumbnails for one image using Pillow's fast downscaling
+
+    Levels wider than the source are skipped rather than upscaled.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    outputs = []
+    with Image.open(path) as img:
+        widths = [width for width in widths if width <= img.width]
+        if not widths:
+            return outputs
+        # For JPEGs, draft() lets the decoder skip DCT scales we would throw away anyway
+        img.draft('RGB', (widths[0], widths[0] * img.height // img.width))
+        level = img.convert('RGB')
+    for width in widths:
+        if level.width >= 2 * width:
+            # reduce() is a cheap integer box filter; finish with an exact resize
+            level = level.reduce(level.width // width)
+        if level.width != width:
+            level = level.resize((width, max(1, round(level.height * width / level.width))), Image.LANCZOS)
+        out_path = os.path.join(output_dir, f'{stem}_{width}.png')
+        level.save(out_path)
+        outputs.append(out_path)
+    return outputs
+
+def _create_thumbnails(job):
+    return create_thumbnails(*job)
+
+def create_all_thumbnails(source_dir='images', output_dir=None, widths=THUMBNAIL_WIDTHS, workers=None):
+    """Thumbnail every PNG/JPEG in source_dir across a process pool"""
+    output_dir = output_dir or os.path.join(source_dir, 'thumbnails')
+    os.makedirs(output_dir, exist_ok=True)
+    paths = sorted(p for pattern in ('*.png', '*.jpg', '*.jpeg')
+                   for p in glob.glob(os.path.join(source_dir, pattern)))
+    jobs = [(path, output_dir, tuple(sorted(widths, reverse=True))) for path in paths]
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for outputs in executor.map(_create_thumbnails, jobs, chunksize=chunksize):
+            if outputs:
+                print(f'Created: {", ".join(outputs)}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create placeholder map images or thumbnails')
+    parser.add_argument('--thumbnails', action='store_true', help='thumbnail existing images instead')
+    parser.add_argument('--source-dir', default='images')
+    parser.add_argument('--output-dir', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
 
-print("\nAll sample images created successfully!")
\ No newline at end of file
+    if args.thumbnails:
+        create_all_thumbnails(args.source_dir, args.output_dir, workers=args.workers)
+        print("\nAll thumbnails created successfully!")
+    else:
+        create_sample_images(output_dir=args.output_dir or 'images', workers=args.workers)
+        print("\nAll sample images created successfully!")
@@ -0,0 +1,289 @@
+"""
+Point features in typed arrays, persisted to a memory-mappable file
+
+A list of {'lat': ..., 'lon': ..., 'label': ...} dicts costs a few hundred
+bytes per point and has to be walked in Python. FeatureStore keeps the
+coordinates in one (n, 2) float64 array (lon, lat - the layout
+geojson_stream uses), numeric attributes in typed arrays, and labels and
+other strings as int32 ids into an interned StringTable, so a label used by
+many points is stored once.
+
+save() writes everything to a single file whose arrays are 64-byte aligned:
+
+    b'LMFEAT01' | header offset (u64) | header length (u64) | arrays... | JSON header
+
+FeatureStore.open() memory-maps that file and wraps the arrays without
+copying or parsing them, so any number of render processes can open the same
+file and share its pages through the OS page cache. A store opened from a
+file pickles as its path, which keeps process-pool task payloads tiny.
+"""
+
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+
+from tiles import TILE_SIZE
+
+MAGIC = b'LMFEAT01'
+ALIGN = 64
+_PREFIX = struct.Struct('<8sQQ')
+# Label id of features without a label
+NO_LABEL = -1
+
+class StringTable:
+    """Interned strings addressed by int32 id, stored as one UTF-8 blob plus offsets"""
+
+    def __init__(self, strings=()):
+        self._strings = []
+        self._ids = {}
+        self._offsets = None
+        self._data = None
+        for s in strings:
+            self.intern(s)
+
+    @classmethod
+    def from_buffers(cls, offsets, data):
+        """Wrap (possibly memory-mapped) offset and blob arrays; strings are decoded on access"""
+        table = cls()
+        table._offsets = offsets
+        table._data = data
+        return table
+
+    def _materialize(self):
+        # Decode a mapped table once, before it is extended
+        if self._offsets is not None:
+            self._strings = [self[i] for i in range(len(self))]
+            self._ids = {s: i for i, s in enumerate(self._strings)}
+            self._offsets = self._data = None
+
+    def intern(self, s):
+        """Id of s, adding it to the table the first time it is seen"""
+        if s is None:
+            return NO_LABEL
+        self._materialize()
+        i = self._ids.get(s)
+        if i is None:
+            i = self._ids[s] = len(self._strings)
+            self._strings.append(s)
+        return i
+
+    def __len__(self):
+        if self._offsets is not None:
+            return len(self._offsets) - 1
+        return len(self._strings)
+
+    def __getitem__(self, i):
+        if i < 0:
+            return None
+        if self._offsets is not None:
+            return bytes(self._data[self._offsets[i]:self._offsets[i + 1]]).decode('utf-8')
+        return self._strings[i]
+
+    def to_buffers(self):
+        """(offsets, data) arrays for saving"""
+        if self._offsets is not None:
+            return self._offsets, self._data
+        encoded = [s.encode('utf-8') for s in self._strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return offsets, data
+
+def _attribute_array(values, strings):
+    """Typed array for one attribute: bool, int64, float64 (None -> NaN) or string ids"""
+    present = [v for v in values if v is not None]
+    if all(isinstance(v, bool) for v in present) and len(present) == len(values):
+        return np.array(values, dtype=np.bool_), False
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        if all(isinstance(v, int) for v in present) and len(present) == len(values):
+            return np.array(values, dtype=np.int64), False
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64), False
+    ids = [strings.intern(v if v is None or isinstance(v, str) else str(v)) for v in values]
+    return np.array(ids, dtype=np.int32), True
+
+class FeatureStore:
+    """Point features: (n, 2) lon/lat coordinates, interned labels and typed attribute columns"""
+
+    def __init__(self, coords, label_ids=None, strings=None, attributes=None, string_attributes=(),
+                 path=None):
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.strings = strings if strings is not None else StringTable()
+        if label_ids is None:
+            label_ids = np.full(len(self.coords), NO_LABEL, dtype=np.int32)
+        self.label_ids = label_ids
+        self.attributes = dict(attributes or {})
+        # Attribute columns holding string ids rather than values
+        self.string_attributes = frozenset(string_attributes)
+        self.path = path
+
+    @classmethod
+    def from_records(cls, records):
+        """Build from marker dicts with 'lat', 'lon', an optional 'label' and any other attributes"""
+        records = list(records)
+        strings = StringTable()
+        coords = np.array([(r['lon'], r['lat']) for r in records], dtype=np.float64).reshape(-1, 2)
+        label_ids = np.array([strings.intern(r.get('label')) for r in records], dtype=np.int32)
+        names = []
+        for r in records:
+            names.extend(k for k in r if k not in ('lat', 'lon', 'label') and k not in names)
+        attributes = {}
+        string_attributes = []
+        for name in names:
+            attributes[name], is_string = _attribute_array([r.get(name) for r in records], strings)
+            if is_string:
+                string_attributes.append(name)
+        return cls(coords, label_ids, strings, attributes, string_attributes)
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """Build from {label: (lon, lat)}, the shape of the `cities` tables in the scripts"""
+        strings = StringTable()
+        label_ids = np.array([strings.intern(label) for label in mapping], dtype=np.int32)
+        return cls(list(mapping.values()), label_ids, strings)
+
+    @classmethod
+    def from_columnar(cls, features, label=None):
+        """Build from the (Multi)Point features of a geojson_stream.ColumnarFeatures
+
+        Every point of a MultiPoint becomes its own feature carrying the
+        properties of the feature it came from.
+        """
+        from geojson_stream import GEOMETRY_CODES
+        point_codes = [GEOMETRY_CODES['Point'], GEOMETRY_CODES['MultiPoint']]
+        selected = np.flatnonzero(np.isin(features.geometry_types, point_codes))
+        ring_starts = features.part_offsets[features.feature_offsets[selected]]
+        ring_ends = features.part_offsets[features.feature_offsets[selected + 1]]
+        starts = features.ring_offsets[ring_starts]
+        counts = features.ring_offsets[ring_ends] - starts
+        # Coordinate index of every point, and the feature it belongs to
+        source = np.repeat(selected, counts)
+        first = np.cumsum(counts) - counts
+        index = np.repeat(starts - first, counts) + np.arange(counts.sum())
+
+        strings = StringTable()
+        attributes = {}
+        string_attributes = []
+        for name, column in features.properties.items():
+            values = column[source]
+            if values.dtype == object:
+                attributes[name] = np.array([strings.intern(v) for v in values], dtype=np.int32)
+                string_attributes.append(name)
+            else:
+                attributes[name] = values
+        label_ids = None
+        if label is not None:
+            label_ids = attributes.pop(label) if label in string_attributes else np.array(
+                [strings.intern(str(v)) for v in features.properties[label][source]], dtype=np.int32)
+            string_attributes = [name for name in string_attributes if name != label]
+        return cls(features.coords[index], label_ids, strings, attributes, string_attributes)
+
+    def __len__(self):
+        return len(self.coords)
+
+    @property
+    def lons(self):
+        return self.coords[:, 0]
+
+    @property
+    def lats(self):
+        return self.coords[:, 1]
+
+    def label(self, i):
+        return self.strings[int(self.label_ids[i])]
+
+    def labels(self):
+        return [self.strings[i] for i in self.label_ids.tolist()]
+
+    def attribute(self, name):
+        """Attribute column; string columns are decoded into a list"""
+        values = self.attributes[name]
+        if name in self.string_attributes:
+            return [self.strings[i] for i in values.tolist()]
+        return values
+
+    def pixels(self, zoom):
+        """Global Web Mercator pixel coordinates (x, y arrays) of every feature at zoom"""
+        world = TILE_SIZE * 2.0 ** zoom
+        x = (self.lons + 180.0) / 360.0 * world
+        y = (1.0 - np.arcsinh(np.tan(np.radians(self.lats))) / np.pi) / 2.0 * world
+        return x, y
+
+    def select(self, mask):
+        """New in-memory store with the features where mask (or an index array) selects"""
+        return FeatureStore(self.coords[mask], self.label_ids[mask], self.strings,
+                            {name: values[mask] for name, values in self.attributes.items()},
+                            self.string_attributes)
+
+    def within(self, bbox):
+        """Features inside (min_lon, min_lat, max_lon, max_lat)"""
+        lons, lats = self.lons, self.lats
+        return self.select((lons >= bbox[0]) & (lons <= bbox[2]) & (lats >= bbox[1]) & (lats <= bbox[3]))
+
+    def __iter__(self):
+        """Marker dicts, for code that still takes lists of {'lat', 'lon', 'label'}"""
+        labels = self.labels()
+        for i, (lon, lat) in enumerate(self.coords.tolist()):
+            marker = {'lat': lat, 'lon': lon}
+            if labels[i] is not None:
+                marker['label'] = labels[i]
+            yield marker
+
+    def save(self, path):
+        """Write the store to path in the memory-mappable format (atomically)"""
+        offsets, data = self.strings.to_buffers()
+        arrays = {'coords': self.coords, 'label_ids': self.label_ids,
+                  'string_offsets': offsets, 'string_data': data}
+        for name, values in self.attributes.items():
+            arrays['attr:' + name] = values
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(b'\0' * ALIGN)
+            layout = {}
+            for name, values in arrays.items():
+                values = np.ascontiguousarray(values)
+                f.write(b'\0' * (-f.tell() % ALIGN))
+                layout[name] = {'dtype': values.dtype.str, 'shape': list(values.shape), 'offset': f.tell()}
+                f.write(values.tobytes())
+            header = json.dumps({'count': len(self), 'arrays': layout,
+                                 'string_attributes': sorted(self.string_attributes)}).encode('utf-8')
+            header_offset = f.tell()
+            f.write(header)
+            f.seek(0)
+            f.write(_PREFIX.pack(MAGIC, header_offset, len(header)))
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a saved store; the arrays are read-only views of the file"""
+        mapped = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, header_offset, header_length = _PREFIX.unpack(bytes(mapped[:_PREFIX.size]))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a feature store file")
+        header = json.loads(bytes(mapped[header_offset:header_offset + header_length]).decode('utf-8'))
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape']))
+            arrays[name] = np.frombuffer(mapped, dtype=dtype, count=count,
+                                         offset=spec['offset']).reshape(spec['shape'])
+        strings = StringTable.from_buffers(arrays['string_offsets'], arrays['string_data'])
+        attributes = {name[len('attr:'):]: values for name, values in arrays.items() if name.startswith('attr:')}
+        return cls(arrays['coords'], arrays['label_ids'], strings, attributes,
+                   header['string_attributes'], path=path)
+
+    def __reduce__(self):
+        # A mapped store travels to worker processes as its path and is mapped again there
+        if self.path is not None:
+            return (FeatureStore.open, (self.path,))
+        return (FeatureStore, (self.coords, self.label_ids, self.strings, self.attributes,
+                               self.string_attributes))
+
+def as_feature_store(markers):
+    """Accept a FeatureStore or a list of marker dicts (None for no markers)"""
+    if markers is None or isinstance(markers, FeatureStore):
+        return markers
+    return FeatureStore.from_records(markers)
@@ -0,0 +1,120 @@
+"""
+Reusable matplotlib figures rendered straight through the Agg canvas
+
+plt.subplots + tight_layout + savefig(bbox_inches='tight') + plt.close
+builds a new figure, lays it out, draws it once to measure the tight
+bounding box and then draws it again, all through pyplot's global state.
+FigurePool keeps one pre-sized figure per (figsize, ncols), clears only
+the artists between maps, measures the tight bounding box with a pass that
+does not rasterize and draws once into a raw RGBA buffer of that size
+before handing it to the PNG encoder. The output is pixel-identical to
+savefig(bbox_inches='tight').
+
+The tight layout is computed once per figure size and axes configuration
+(limits, titles, axis labels and colorbars - what decides the margins) and
+reapplied with subplots_adjust for every later map that matches it.
+"""
+
+import io
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+class _PooledFigure:
+    def __init__(self, figsize, ncols, dpi, facecolor):
+        self.figure = Figure(figsize=figsize, dpi=dpi, facecolor=facecolor)
+        self.canvas = FigureCanvasAgg(self.figure)
+        axes = self.figure.subplots(1, ncols)
+        self.axes = list(axes) if ncols > 1 else [axes]
+        self.subplotspecs = [ax.get_subplotspec() for ax in self.axes]
+        self.facecolors = [ax.get_facecolor() for ax in self.axes]
+        # Layout signature -> subplot parameters computed by tight_layout
+        self.layouts = {}
+        pars = self.figure.subplotpars
+        self.default_layout = dict(left=pars.left, right=pars.right, bottom=pars.bottom,
+                                   top=pars.top, wspace=pars.wspace, hspace=pars.hspace)
+
+    def reset(self):
+        """Remove everything drawn by the previous map but keep the layout"""
+        fig = self.figure
+        for ax in list(fig.axes):
+            if ax not in self.axes:
+                # Colorbars and other axes added by the previous map
+                ax.remove()
+        # Removing the suptitle also detaches it from the figure
+        for text in list(fig.texts):
+            text.remove()
+        for ax, subplotspec, facecolor in zip(self.axes, self.subplotspecs, self.facecolors):
+            ax.cla()
+            # A colorbar moves its parent into a nested gridspec; put it back
+            ax.set_subplotspec(subplotspec)
+            # cla() keeps the last set_facecolor(), so restore it explicitly
+            ax.set_facecolor(facecolor)
+            ax.set_anchor('C')
+
+    def layout_signature(self):
+        """Everything that decides the tight-layout margins of the current map"""
+        fig = self.figure
+        # Titles are centred over the axes, so only whether there is one (not its text) matters
+        axes = tuple(
+            (ax in self.axes, ax.get_xlim(), ax.get_ylim(), bool(ax.get_title()), ax.title.get_fontsize(),
+             ax.get_xlabel(), ax.get_ylabel())
+            for ax in fig.axes
+        )
+        return axes, fig.get_suptitle()
+
+    def apply_layout(self):
+        """Reuse the tight layout of an identically configured earlier map, or compute it"""
+        signature = self.layout_signature()
+        params = self.layouts.get(signature)
+        if params is None:
+            # tight_layout refines the current margins, so always start from the defaults
+            self.figure.subplots_adjust(**self.default_layout)
+            self.figure.tight_layout()
+            pars = self.figure.subplotpars
+            params = self.layouts[signature] = dict(left=pars.left, right=pars.right, bottom=pars.bottom,
+                                                    top=pars.top, wspace=pars.wspace, hspace=pars.hspace)
+        else:
+            self.figure.subplots_adjust(**params)
+
+class FigurePool:
+    """Hand out cleared, already laid-out figures and save them without pyplot"""
+
+    def __init__(self, dpi=100, facecolor='white', pad_inches=0.1):
+        self.dpi = dpi
+        self.facecolor = facecolor
+        self.pad_inches = pad_inches
+        self._pool = {}
+        self._by_figure = {}
+
+    def acquire(self, figsize=(8, 6), ncols=1):
+        """Return (fig, ax) - or (fig, axes) when ncols > 1 - ready for a new map"""
+        key = (tuple(figsize), ncols)
+        pooled = self._pool.get(key)
+        if pooled is None:
+            pooled = self._pool[key] = _PooledFigure(figsize, ncols, self.dpi, self.facecolor)
+            self._by_figure[id(pooled.figure)] = pooled
+        else:
+            pooled.reset()
+        axes = pooled.axes
+        return pooled.figure, (axes if ncols > 1 else axes[0])
+
+    def render(self, fig):
+        """Draw the figure once and return it as an RGBA image cropped like bbox_inches='tight'"""
+        pooled = self._by_figure[id(fig)]
+        pooled.apply_layout()
+        # The same measuring pass as savefig: layout and text extents without rasterizing
+        fig.draw_without_rendering()
+        bbox = fig.get_tightbbox().padded(self.pad_inches)
+        # Drawing through savefig with that bbox shifts the artists exactly as bbox_inches='tight'
+        # does; cropping a full-canvas draw instead moves edges that fall on a half pixel
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='rgba', dpi=self.dpi, bbox_inches=bbox, facecolor=self.facecolor)
+        renderer = pooled.canvas.renderer
+        return Image.frombuffer('RGBA', (int(renderer.width), int(renderer.height)), buffer.getbuffer(),
+                                'raw', 'RGBA', 0, 1)
+
+    def save(self, fig, path):
+        """Render the figure to a PNG file"""
+        self.render(fig).save(path)
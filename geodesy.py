@@ -0,0 +1,207 @@
+"""
+Vectorized geodesic distances, polyline lengths and polygon areas
+
+Everything works on NumPy arrays in one call, so millions of GPS segments
+are measured without a Python-level loop. Coordinates are in degrees,
+results in metres and square metres.
+
+Many polylines or rings can be passed together as flat coordinate arrays
+plus an `offsets` array: polyline i spans indices offsets[i]:offsets[i+1]
+(offsets starts with 0 and ends with the number of vertices).
+"""
+
+import numpy as np
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+# Mean Earth radius (IUGG), used by haversine
+EARTH_RADIUS = 6371008.8
+
+def haversine(lat1, lon1, lat2, lon2, radius=EARTH_RADIUS):
+    """Great-circle distance on a sphere; fast, within ~0.5% of the ellipsoidal distance"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * radius * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+def _vincenty_step(L, lam, sin_u1, cos_u1, sin_u2, cos_u2, f):
+    """One iteration of Vincenty's inverse formula: the new lambda and the terms the distance needs"""
+    sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+    sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+    cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+    sigma = np.arctan2(sin_sigma, cos_sigma)
+    sin_alpha = np.divide(cos_u1 * cos_u2 * sin_lam, sin_sigma,
+                          out=np.zeros_like(sin_sigma), where=sin_sigma != 0)
+    cos2_alpha = 1 - sin_alpha ** 2
+    # Equatorial lines have cos2_alpha == 0
+    cos_2sigma_m = np.divide(cos_sigma * cos2_alpha - 2 * sin_u1 * sin_u2, cos2_alpha,
+                             out=np.zeros_like(cos2_alpha), where=cos2_alpha != 0)
+    C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+    lam_new = L + (1 - C) * f * sin_alpha * (
+        sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+    return lam_new, (sin_sigma, cos_sigma, sigma, cos2_alpha, cos_2sigma_m)
+
+def vincenty(lat1, lon1, lat2, lon2, a=WGS84_A, f=WGS84_F, tol=1e-12, max_iter=200):
+    """Ellipsoidal distance with Vincenty's inverse formula, iterated over whole arrays
+
+    Each iteration only recomputes the pairs that have not converged yet, so
+    a few slow pairs do not keep the whole array iterating. Vincenty does not
+    converge for nearly antipodal points; those fall back to haversine, which
+    is far from the case that matters for GPS tracks.
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.radians(np.asarray(v, dtype=float))
+                                                   for v in (lat1, lon1, lat2, lon2)))
+    shape = lat1.shape
+    b = (1 - f) * a
+    L = (lon2 - lon1).ravel()
+    U1 = np.arctan((1 - f) * np.tan(lat1.ravel()))
+    U2 = np.arctan((1 - f) * np.tan(lat2.ravel()))
+    sin_u1, cos_u1 = np.sin(U1), np.cos(U1)
+    sin_u2, cos_u2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    # sin_sigma, cos_sigma, sigma, cos2_alpha, cos_2sigma_m of every pair
+    terms = np.zeros((5, L.size))
+    converged = np.zeros(L.size, dtype=bool)
+    # Indices of the pairs still iterating
+    active = np.arange(L.size)
+    for _ in range(max_iter):
+        if active.size == 0:
+            break
+        lam_new, active_terms = _vincenty_step(L[active], lam[active], sin_u1[active], cos_u1[active],
+                                               sin_u2[active], cos_u2[active], f)
+        terms[:, active] = active_terms
+        done = np.abs(lam_new - lam[active]) < tol
+        lam[active] = lam_new
+        converged[active[done]] = True
+        active = active[~done]
+    sin_sigma, cos_sigma, sigma, cos2_alpha, cos_2sigma_m = terms
+
+    u2 = cos2_alpha * (a ** 2 - b ** 2) / b ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+        - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+    distance = (b * A * (sigma - delta_sigma)).reshape(shape)
+
+    if not converged.all():
+        fallback = haversine(np.degrees(lat1), np.degrees(lon1), np.degrees(lat2), np.degrees(lon2))
+        distance = np.where(converged.reshape(shape), distance, fallback)
+    return distance
+
+DISTANCE_METHODS = {'haversine': haversine, 'vincenty': vincenty}
+
+def _distance_function(method):
+    try:
+        return DISTANCE_METHODS[method]
+    except KeyError:
+        raise ValueError(f"Unknown method {method!r}, expected one of {sorted(DISTANCE_METHODS)}")
+
+def _check_offsets(offsets, n):
+    if offsets is None:
+        return np.array([0, n])
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if offsets[0] != 0 or offsets[-1] != n or np.any(np.diff(offsets) < 0):
+        raise ValueError("offsets must start at 0, end at the number of vertices and never decrease")
+    return offsets
+
+def segment_lengths(lats, lons, offsets=None, method='vincenty'):
+    """Length of every segment (n - 1 values); segments joining two polylines are 0"""
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    offsets = _check_offsets(offsets, len(lats))
+    lengths = _distance_function(method)(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    # The "segment" from the last vertex of one polyline to the first of the next
+    # (none before the first vertex or after the last, where empty polylines can start)
+    boundaries = offsets[1:-1]
+    lengths[boundaries[(boundaries > 0) & (boundaries < len(lats))] - 1] = 0.0
+    return lengths
+
+def cumulative_lengths(lats, lons, offsets=None, method='vincenty'):
+    """Distance along its polyline for every vertex, restarting at 0 for each polyline"""
+    offsets = _check_offsets(offsets, len(lats))
+    total = np.concatenate([[0.0], np.cumsum(segment_lengths(lats, lons, offsets, method))])
+    counts = np.diff(offsets)
+    # Subtract the running total at each polyline's first vertex (empty polylines have none)
+    nonempty = counts > 0
+    starts = np.repeat(total[offsets[:-1][nonempty]], counts[nonempty])
+    return total - starts
+
+def polyline_lengths(lats, lons, offsets=None, method='vincenty'):
+    """Total length of each polyline"""
+    offsets = _check_offsets(offsets, len(lats))
+    cumulative = cumulative_lengths(lats, lons, offsets, method)
+    ends = offsets[1:] - 1
+    lengths = np.zeros(len(offsets) - 1)
+    nonempty = np.diff(offsets) > 0
+    lengths[nonempty] = cumulative[ends[nonempty]]
+    return lengths
+
+def _authalic(lats_rad, a, f):
+    """Map geodetic latitudes to authalic latitudes, and return the authalic sphere radius"""
+    e2 = f * (2 - f)
+    e = np.sqrt(e2)
+
+    def q(sin_phi):
+        return (1 - e2) * (sin_phi / (1 - e2 * sin_phi ** 2)
+                           - np.log((1 - e * sin_phi) / (1 + e * sin_phi)) / (2 * e))
+
+    qp = q(1.0)
+    beta = np.arcsin(np.clip(q(np.sin(lats_rad)) / qp, -1.0, 1.0))
+    return beta, a * np.sqrt(qp / 2)
+
+def polygon_areas(lats, lons, offsets=None, a=WGS84_A, f=WGS84_F):
+    """Area of each ring, from its spherical excess on the equal-area (authalic) sphere
+
+    Rings may be open or closed (first vertex repeated). Edges are treated as
+    great circles on the authalic sphere, which matches geodesic areas to well
+    under 0.1% for anything smaller than a continent.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    offsets = _check_offsets(offsets, len(lats))
+    counts = np.diff(offsets)
+    n = len(lats)
+    if n == 0:
+        return np.zeros(len(counts))
+
+    beta, radius = _authalic(np.radians(lats), a, f)
+    lam = np.radians(lons)
+    # Index of the next vertex within the same ring (the last wraps to the first)
+    following = np.arange(1, n + 1)
+    nonempty = counts > 0
+    following[offsets[1:][nonempty] - 1] = offsets[:-1][nonempty]
+
+    t1 = np.tan(beta / 2)
+    t2 = t1[following]
+    d_lam = lam[following] - lam
+    # Keep longitude steps in (-pi, pi] so rings crossing the antimeridian work
+    d_lam = (d_lam + np.pi) % (2 * np.pi) - np.pi
+    excess = 2 * np.arctan2(np.tan(d_lam / 2) * (t1 + t2), 1 + t1 * t2)
+
+    ring_ids = np.repeat(np.arange(len(counts)), counts)
+    totals = np.bincount(ring_ids, weights=excess, minlength=len(counts))
+    return np.abs(totals) * radius ** 2
+
+def polygon_area(lats, lons):
+    """Area of a single ring"""
+    return float(polygon_areas(lats, lons)[0])
+
+def line_length(lats, lons, method='vincenty'):
+    """Length of a single polyline"""
+    return float(polyline_lengths(lats, lons, method=method)[0])
+
+def format_distance(metres):
+    """Human-readable distance label"""
+    if metres >= 1000:
+        return f'{metres / 1000:.2f} km' if metres < 100000 else f'{metres / 1000:.0f} km'
+    return f'{metres:.0f} m'
+
+def format_area(square_metres):
+    """Human-readable area label"""
+    if square_metres >= 1e6:
+        return f'{square_metres / 1e6:.2f} km²'
+    if square_metres >= 1e4:
+        return f'{square_metres / 1e4:.1f} ha'
+    return f'{square_metres:.0f} m²'
@@ -0,0 +1,423 @@
+"""
+Stream GeoJSON into contiguous NumPy coordinate buffers
+
+json.load() on a large FeatureCollection builds a dict per feature and a
+list per coordinate pair, many times the size of the file. load_geojson()
+instead decodes one feature at a time from a rolling text buffer and
+appends its coordinates to growable float64 buffers, so only the current
+feature is ever held as Python objects.
+
+The result is columnar:
+
+    coords[ring_offsets[r]:ring_offsets[r + 1]]       vertices of ring r
+    ring_offsets[part_offsets[p]:part_offsets[p + 1]] rings of part p
+    part_offsets[feature_offsets[f]:...[f + 1]]       parts of feature f
+
+A part is one Polygon (outer ring + holes), one LineString or the points of
+a (Multi)Point. Slices of coords are zero-copy views, which is what the
+drawing helpers at the bottom hand to matplotlib, staticmap and the marker
+based renderers.
+"""
+
+import json
+
+import numpy as np
+
+GEOMETRY_TYPES = ('Point', 'MultiPoint', 'LineString', 'MultiLineString', 'Polygon', 'MultiPolygon')
+GEOMETRY_CODES = {name: code for code, name in enumerate(GEOMETRY_TYPES)}
+# Features without a (supported) geometry
+NO_GEOMETRY = 255
+
+_decoder = json.JSONDecoder()
+
+class _Growable:
+    """Append-only NumPy buffer that doubles its capacity when full"""
+
+    def __init__(self, dtype, width=None, capacity=1024):
+        shape = (capacity,) if width is None else (capacity, width)
+        self.data = np.empty(shape, dtype=dtype)
+        self.size = 0
+
+    def _reserve(self, extra):
+        needed = self.size + extra
+        if needed > len(self.data):
+            capacity = max(needed, 2 * len(self.data))
+            grown = np.empty((capacity,) + self.data.shape[1:], dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+
+    def append(self, value):
+        self._reserve(1)
+        self.data[self.size] = value
+        self.size += 1
+
+    def extend(self, values):
+        self._reserve(len(values))
+        self.data[self.size:self.size + len(values)] = values
+        self.size += len(values)
+
+    def view(self):
+        return self.data[:self.size]
+
+class _Column:
+    """One property column, promoted bool -> int -> float -> str as values require
+
+    Values stored before a promotion to str become their JSON text:
+
+    >>> codes, flags = _Column(0), _Column(0)
+    >>> for code, flag in ((12345, True), ('A1', 'n/a')):
+    ...     codes.append(code)
+    ...     flags.append(flag)
+    >>> codes.finish().tolist(), flags.finish().tolist()
+    (['12345', 'A1'], ['true', 'n/a'])
+    """
+
+    KINDS = ('bool', 'int', 'float', 'str')
+
+    def __init__(self, rows_before):
+        self.kind = 'bool'
+        self.values = _Growable(np.bool_)
+        self.valid = _Growable(np.bool_)
+        # Features seen before this property first appeared are missing
+        for _ in range(rows_before):
+            self.append(None)
+
+    def _promote(self, kind):
+        if self.KINDS.index(kind) <= self.KINDS.index(self.kind):
+            return
+        old = self.values.view()
+        if kind == 'str':
+            # tolist() gives Python scalars, which json.dumps accepts and NumPy scalars are not
+            converted = np.array([_to_str(v) if ok else None
+                                  for v, ok in zip(old.tolist(), self.valid.view().tolist())], dtype=object)
+        else:
+            converted = old.astype(np.int64 if kind == 'int' else np.float64)
+        self.values = _Growable(converted.dtype, capacity=max(len(converted), 1024))
+        self.values.extend(converted)
+        self.kind = kind
+
+    def append(self, value):
+        if value is None:
+            self.values.append(None if self.kind == 'str' else 0)
+            self.valid.append(False)
+            return
+        if isinstance(value, bool):
+            kind = 'bool'
+        elif isinstance(value, int):
+            kind = 'int'
+        elif isinstance(value, float):
+            kind = 'float'
+        else:
+            kind = 'str'
+        self._promote(kind)
+        self.values.append(_to_str(value) if self.kind == 'str' else value)
+        self.valid.append(True)
+
+    def finish(self):
+        values = self.values.view()
+        valid = self.valid.view()
+        if valid.all():
+            return values
+        if self.kind in ('bool', 'int'):
+            # Missing integers are represented as NaN like pandas does
+            values = values.astype(np.float64)
+            self.kind = 'float'
+        if self.kind == 'float':
+            values = values.copy()
+            values[~valid] = np.nan
+        return values
+
+def _to_str(value):
+    if isinstance(value, str):
+        return value
+    # Nested objects and arrays are kept as their JSON text
+    return json.dumps(value, ensure_ascii=False)
+
+class _TextStream:
+    """Rolling text buffer over a file that lets raw_decode work on one value at a time"""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, minimum=1):
+        """Make sure at least `minimum` characters are buffered past pos (unless at EOF)"""
+        if len(self.buffer) - self.pos >= minimum or self.eof:
+            return
+        # Drop what has been consumed so the buffer stays bounded
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        while len(self.buffer) < minimum and not self.eof:
+            chunk = self.f.read(max(self.chunk_size, minimum - len(self.buffer)))
+            if not chunk:
+                self.eof = True
+            self.buffer += chunk
+
+    def skip_whitespace(self):
+        while True:
+            self.fill()
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return
+
+    def peek(self):
+        self.skip_whitespace()
+        if self.pos >= len(self.buffer):
+            raise ValueError("Unexpected end of GeoJSON")
+        return self.buffer[self.pos]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, found {self.buffer[self.pos]!r}")
+        self.pos += 1
+
+    def decode(self):
+        """Decode the next JSON value, reading more text until it is complete"""
+        self.skip_whitespace()
+        wanted = self.chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                # Grow geometrically so huge features are not re-parsed many times
+                wanted *= 2
+                self.fill(len(self.buffer) - self.pos + wanted)
+                continue
+            # A number at the very end of the buffer may have been cut short
+            if end == len(self.buffer) and not self.eof:
+                self.fill(len(self.buffer) - self.pos + self.chunk_size)
+                if len(self.buffer) > end:
+                    continue
+            self.pos = end
+            return value
+
+def iter_features(path, chunk_size=1 << 20):
+    """Yield the features of a GeoJSON file one at a time without loading the whole file
+
+    Handles a FeatureCollection (the "features" array is streamed, other
+    members are skipped), a single Feature, or a bare geometry.
+    """
+    with open(path, encoding='utf-8') as f:
+        stream = _TextStream(f, chunk_size)
+        stream.expect('{')
+        first = True
+        other = {}
+        while stream.peek() != '}':
+            if not first:
+                stream.expect(',')
+            first = False
+            key = stream.decode()
+            stream.expect(':')
+            if key != 'features':
+                other[key] = stream.decode()
+                continue
+            stream.expect('[')
+            first_feature = True
+            while stream.peek() != ']':
+                if not first_feature:
+                    stream.expect(',')
+                first_feature = False
+                yield stream.decode()
+            stream.expect(']')
+        stream.expect('}')
+
+    # Not a FeatureCollection: the object itself is a Feature or a geometry
+    kind = other.get('type')
+    if kind == 'Feature':
+        yield other
+    elif kind in GEOMETRY_CODES:
+        yield {'type': 'Feature', 'geometry': other, 'properties': {}}
+
+class ColumnarFeatures:
+    """Features as flat coordinate buffers with offset arrays and typed property columns"""
+
+    def __init__(self, coords, ring_offsets, part_offsets, feature_offsets, geometry_types, properties):
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.part_offsets = part_offsets
+        self.feature_offsets = feature_offsets
+        self.geometry_types = geometry_types
+        self.properties = properties
+
+    def __len__(self):
+        return len(self.geometry_types)
+
+    @property
+    def lons(self):
+        return self.coords[:, 0]
+
+    @property
+    def lats(self):
+        return self.coords[:, 1]
+
+    def geometry_type(self, i):
+        code = self.geometry_types[i]
+        return GEOMETRY_TYPES[code] if code != NO_GEOMETRY else None
+
+    def ring(self, r):
+        """Vertices of ring r as a zero-copy (n, 2) view"""
+        return self.coords[self.ring_offsets[r]:self.ring_offsets[r + 1]]
+
+    def part_rings(self, p):
+        """Rings of part p (outer ring first for polygons)"""
+        return [self.ring(r) for r in range(self.part_offsets[p], self.part_offsets[p + 1])]
+
+    def feature_parts(self, i):
+        """Parts of feature i, each a list of ring views"""
+        return [self.part_rings(p) for p in range(self.feature_offsets[i], self.feature_offsets[i + 1])]
+
+    def bounds(self):
+        """(min_lon, min_lat, max_lon, max_lat) of all coordinates"""
+        if len(self.coords) == 0:
+            return None
+        return (*self.coords.min(axis=0).tolist(), *self.coords.max(axis=0).tolist())
+
+    def _features_of(self, codes):
+        return np.flatnonzero(np.isin(self.geometry_types, [GEOMETRY_CODES[c] for c in codes]))
+
+    def polygon_rings(self):
+        """All polygon rings (outer rings and holes) as views, e.g. for a PolyCollection"""
+        return [ring for i in self._features_of(('Polygon', 'MultiPolygon'))
+                for part in self.feature_parts(i) for ring in part]
+
+    def line_rings(self):
+        return [ring for i in self._features_of(('LineString', 'MultiLineString'))
+                for part in self.feature_parts(i) for ring in part]
+
+    def point_coords(self):
+        """Coordinates of all (Multi)Point features as one (n, 2) array"""
+        features = self._features_of(('Point', 'MultiPoint'))
+        if len(features) == 0:
+            return np.empty((0, 2))
+        rings = [ring for i in features for part in self.feature_parts(i) for ring in part]
+        return np.concatenate(rings)
+
+    def draw_on_axes(self, ax, facecolor='#e8dcc6', edgecolor='#666666', linewidth=1, color='blue',
+                     markersize=20):
+        """Add polygons, lines and points to a matplotlib axes (as create_realistic_maps does)"""
+        from matplotlib.collections import LineCollection, PolyCollection
+        polygons = self.polygon_rings()
+        if polygons:
+            ax.add_collection(PolyCollection(polygons, facecolors=facecolor, edgecolors=edgecolor,
+                                             linewidths=linewidth))
+        lines = self.line_rings()
+        if lines:
+            ax.add_collection(LineCollection(lines, colors=color, linewidths=linewidth * 2))
+        points = self.point_coords()
+        if len(points):
+            ax.scatter(points[:, 0], points[:, 1], s=markersize, c=color, zorder=3)
+        return ax
+
+    def add_to_staticmap(self, m, fill_color='#e8dcc680', outline_color='#666666', line_color='blue',
+                         line_width=3, marker_color='red', marker_size=8):
+        """Add the features to a staticmap.StaticMap (as generate_static_maps does)"""
+        import staticmap
+        for i in self._features_of(('Polygon', 'MultiPolygon')):
+            for part in self.feature_parts(i):
+                # staticmap polygons have no holes; draw the outer ring
+                m.add_polygon(staticmap.Polygon(part[0].tolist(), fill_color, outline_color))
+        for ring in self.line_rings():
+            m.add_line(staticmap.Line(ring.tolist(), line_color, line_width))
+        for lon, lat in self.point_coords():
+            m.add_marker(staticmap.CircleMarker((lon, lat), marker_color, marker_size))
+        return m
+
+    def point_markers(self, label=None):
+        """Marker dicts for create_static_map_image and render_poster, labelled from a property"""
+        markers = []
+        labels = self.properties.get(label) if label else None
+        for i in self._features_of(('Point', 'MultiPoint')):
+            for part in self.feature_parts(i):
+                for ring in part:
+                    for lon, lat in ring:
+                        marker = {'lat': float(lat), 'lon': float(lon)}
+                        if labels is not None and labels[i] is not None:
+                            marker['label'] = str(labels[i])
+                        markers.append(marker)
+        return markers
+
+def load_geojson(path, properties=None, chunk_size=1 << 20):
+    """Stream a GeoJSON file into a ColumnarFeatures
+
+    properties: names of the properties to keep (None keeps all, [] none);
+    dropping unneeded columns keeps memory down for very large files.
+    """
+    coords = _Growable(np.float64, width=2, capacity=1 << 16)
+    ring_offsets = _Growable(np.int64)
+    part_offsets = _Growable(np.int64)
+    feature_offsets = _Growable(np.int64)
+    geometry_types = _Growable(np.uint8)
+    ring_offsets.append(0)
+    part_offsets.append(0)
+    feature_offsets.append(0)
+    columns = {}
+    keep = None if properties is None else set(properties)
+    n_features = 0
+
+    def add_ring(ring):
+        array = np.asarray(ring, dtype=np.float64)
+        # Empty rings and empty positions ([] or [[]]) add no coordinates
+        array = array.reshape(-1, array.shape[-1]) if array.size else np.empty((0, 2))
+        # Drop Z/M values
+        coords.extend(array[:, :2])
+        ring_offsets.append(coords.size)
+
+    def end_part():
+        part_offsets.append(ring_offsets.size - 1)
+
+    for feature in iter_features(path, chunk_size):
+        geometry = feature.get('geometry') or {}
+        kind = geometry.get('type')
+        c = geometry.get('coordinates')
+        if not c:
+            # Empty coordinates (allowed by RFC 7946) are read as a null geometry
+            kind = None
+        elif kind == 'Point':
+            add_ring([c])
+            end_part()
+        elif kind in ('MultiPoint', 'LineString'):
+            add_ring(c)
+            end_part()
+        elif kind == 'MultiLineString':
+            for line in c:
+                add_ring(line)
+                end_part()
+        elif kind == 'Polygon':
+            for ring in c:
+                add_ring(ring)
+            end_part()
+        elif kind == 'MultiPolygon':
+            for polygon in c:
+                for ring in polygon:
+                    add_ring(ring)
+                end_part()
+        else:
+            # null geometry, GeometryCollection or unknown type
+            kind = None
+        geometry_types.append(GEOMETRY_CODES[kind] if kind else NO_GEOMETRY)
+        feature_offsets.append(part_offsets.size - 1)
+
+        props = feature.get('properties') or {}
+        for name, value in props.items():
+            if keep is not None and name not in keep:
+                continue
+            if name not in columns:
+                columns[name] = _Column(n_features)
+        for name, column in columns.items():
+            column.append(props.get(name))
+        n_features += 1
+
+    return ColumnarFeatures(
+        coords=coords.view(),
+        ring_offsets=ring_offsets.view(),
+        part_offsets=part_offsets.view(),
+        feature_offsets=feature_offsets.view(),
+        geometry_types=geometry_types.view(),
+        properties={name: column.finish() for name, column in columns.items()},
+    )
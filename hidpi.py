@@ -0,0 +1,83 @@
+"""
+High-DPI (@2x/@3x) rendering with scale-aware tile selection
+
+A map at zoom z can be rendered at a device pixel ratio `scale` in two ways:
+
+- retina: fetch the provider's @{scale}x tiles at zoom z. Same number of
+  tiles, each (256 * scale)^2 pixels. Only possible when the URL template
+  contains {r} and the provider serves that scale.
+- overzoom: fetch normal tiles at zoom z + k with 2^k >= scale. That is
+  4^k times as many tiles; when 2^k != scale the mosaic is downsampled.
+"""
+
+import math
+from collections import namedtuple
+from PIL import Image
+
+from tiles import TILE_SIZE, TILE_URL, get_tile, http_fetch
+
+# Scales most {r}-aware providers serve
+RETINA_SCALES = (2,)
+# Highest zoom level tile.openstreetmap.org serves
+MAX_ZOOM = 19
+
+# strategy: 'native', 'retina', 'overzoom' or 'upscale'
+# factor: fetched pixels per output pixel at scale 1
+ScalePlan = namedtuple('ScalePlan', ['strategy', 'zoom', 'tile_scale', 'factor'])
+
+def plan_scale(zoom, scale, tile_url=TILE_URL, retina_scales=RETINA_SCALES, max_zoom=MAX_ZOOM):
+    """Choose how tiles are fetched for a scale-x rendering at zoom"""
+    if scale == 1:
+        return ScalePlan('native', zoom, 1, 1)
+    if '{r}' in tile_url and scale in retina_scales:
+        return ScalePlan('retina', zoom, scale, scale)
+    k = max(0, math.ceil(math.log2(scale)))
+    if zoom + k > max_zoom:
+        # No deeper tiles exist - fetch what there is and upscale
+        k = max(0, max_zoom - zoom)
+        return ScalePlan('upscale', zoom + k, 1, 2 ** k)
+    return ScalePlan('overzoom', zoom + k, 1, 2 ** k)
+
+def tile_count(plan, width, height):
+    """Upper bound on the tiles a plan fetches for a width x height (scale 1) region"""
+    tile_px = TILE_SIZE * plan.tile_scale
+    cols = math.ceil(width * plan.factor / tile_px) + 1
+    rows = math.ceil(height * plan.factor / tile_px) + 1
+    return cols * rows
+
+def render_region(zoom, left, top, width, height, scale=1, tile_url=TILE_URL, retina_scales=RETINA_SCALES,
+                  tile_dir=None, offline=False, synthesizer=None, fetch_factory=http_fetch):
+    """Stitch a region given in global pixels at zoom, returning a (width * scale, height * scale) image
+
+    fetch_factory(url, tile_scale) builds the fetch function for the chosen plan.
+    Returns (image, plan).
+    """
+    plan = plan_scale(zoom, scale, tile_url, retina_scales)
+    fetch = None if offline else fetch_factory(tile_url, plan.tile_scale)
+    if plan.tile_scale != 1:
+        # Synthesized tiles are always normal resolution
+        synthesizer = None
+
+    factor = plan.factor
+    tile_px = TILE_SIZE * plan.tile_scale
+    region_left = int(math.floor(left * factor))
+    region_top = int(math.floor(top * factor))
+    region_right = int(math.ceil((left + width) * factor))
+    region_bottom = int(math.ceil((top + height) * factor))
+
+    mosaic = Image.new('RGB', (region_right - region_left, region_bottom - region_top))
+    for ty in range(region_top // tile_px, (region_bottom - 1) // tile_px + 1):
+        for tx in range(region_left // tile_px, (region_right - 1) // tile_px + 1):
+            tile = get_tile(plan.zoom, tx, ty, tile_dir=tile_dir, fetch=fetch,
+                            synthesizer=synthesizer, scale=plan.tile_scale)
+            mosaic.paste(tile, (tx * tile_px - region_left, ty * tile_px - region_top))
+
+    out_size = (round(width * scale), round(height * scale))
+    if mosaic.size != out_size:
+        ratio = factor / scale
+        if ratio == int(ratio) and ratio > 1:
+            # Integer box reduction is much cheaper than a general resample
+            mosaic = mosaic.reduce(int(ratio))
+        if mosaic.size != out_size:
+            mosaic = mosaic.resize(out_size, Image.LANCZOS, reducing_gap=2.0)
+    return mosaic, plan
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Local HTTP service that renders static maps on request
+
+    python map_service.py --port 8080
+    curl 'http://127.0.0.1:8080/map?lat=35.6762&lon=139.6503&zoom=12&markers=35.6586,139.7454,Tower'
+
+Query parameters: lat, lon, zoom (required), width, height, scale,
+format (png/jpeg), title and markers ("lat,lon[,label]" separated by ";").
+
+- asyncio front end; renders run in a bounded process pool (pyplot is not
+  thread-safe, and processes keep the event loop responsive)
+- encoded responses are kept in an in-memory LRU with a byte budget
+- identical requests that arrive while one is rendering share its result
+- responses carry an ETag, and If-None-Match answers 304
+
+By default tiles come from the local stand-in source, so the service runs
+without network access; --tile-source osm uses tile.openstreetmap.org and
+--tile-source PATH reads a local .mbtiles or .pmtiles archive.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from urllib.parse import urlsplit, parse_qs
+
+from tiles import http_fetch, stand_in_fetch
+from tile_sources import open_tile_source
+
+CONTENT_TYPES = {'png': 'image/png', 'jpeg': 'image/jpeg'}
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+MAX_SIZE = 4096
+
+class ResponseCache:
+    """LRU of encoded responses bounded by total bytes rather than entry count"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, etag, body):
+        if len(body) > self.max_bytes:
+            # Never let one huge response flush the whole cache
+            return
+        if key in self._entries:
+            self.size -= len(self._entries.pop(key)[1])
+        self._entries[key] = (etag, body)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+def parse_markers(value):
+    """Parse 'lat,lon[,label];...' into the marker dicts render_static_map takes"""
+    markers = []
+    for item in value.split(';'):
+        if not item:
+            continue
+        parts = item.split(',', 2)
+        if len(parts) < 2:
+            raise ValueError(f"marker {item!r} needs at least lat,lon")
+        marker = {'lat': float(parts[0]), 'lon': float(parts[1])}
+        if len(parts) == 3 and parts[2]:
+            marker['label'] = parts[2]
+        markers.append(marker)
+    return tuple(markers)
+
+def parse_map_query(query):
+    """Validate /map query parameters into a canonical, hashable request key"""
+    params = {name: values[-1] for name, values in parse_qs(query, keep_blank_values=True).items()}
+    try:
+        lat = float(params['lat'])
+        lon = float(params['lon'])
+        zoom = int(params['zoom'])
+    except KeyError as e:
+        raise ValueError(f"missing parameter {e.args[0]!r}")
+    width = int(params.get('width', 800))
+    height = int(params.get('height', 600))
+    scale = int(params.get('scale', 1))
+    fmt = params.get('format', 'png').lower()
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if not -85.0511 <= lat <= 85.0511 or not -180 <= lon <= 180:
+        raise ValueError("lat/lon out of range")
+    if not 0 <= zoom <= 19:
+        raise ValueError("zoom must be between 0 and 19")
+    if not (16 <= width <= MAX_SIZE and 16 <= height <= MAX_SIZE):
+        raise ValueError(f"width and height must be between 16 and {MAX_SIZE}")
+    if scale not in (1, 2, 3):
+        raise ValueError("scale must be 1, 2 or 3")
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f"format must be one of {sorted(CONTENT_TYPES)}")
+    markers = parse_markers(params.get('markers', ''))
+    # Round coordinates so trivially different requests share a cache entry
+    return (round(lat, 6), round(lon, 6), zoom, width, height, scale, fmt, params.get('title', ''),
+            tuple(tuple(sorted(m.items())) for m in markers))
+
+@lru_cache(maxsize=None)
+def _archive(path):
+    """Tile archive opened once per worker process"""
+    return open_tile_source(path)
+
+def render_key(key, tile_source):
+    """Worker-process entry point: render the map for a request key"""
+    # Imported here so the front end process never loads matplotlib
+    import matplotlib
+    matplotlib.use('Agg')
+    from generate_osm_maps import render_static_map
+
+    lat, lon, zoom, width, height, scale, fmt, title, markers = key
+    if tile_source == 'osm':
+        options = {'fetch_factory': http_fetch}
+    elif tile_source == 'stand-in':
+        options = {'fetch_factory': stand_in_fetch, 'tile_dir': None}
+    else:
+        options = {'fetch_factory': _archive(tile_source).fetch_factory, 'tile_dir': None}
+    return render_static_map(lat, lon, zoom, width, height, markers=[dict(m) for m in markers],
+                             title=title or None, format=fmt, scale=scale, **options)
+
+class MapService:
+    """Request handling, caching and render coalescing for the map HTTP server"""
+
+    def __init__(self, workers=2, max_pending=32, cache_bytes=64 * 1024 * 1024, tile_source='stand-in'):
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.max_pending = max_pending
+        self.tile_source = tile_source
+        self.cache = ResponseCache(cache_bytes)
+        self.in_flight = {}
+        self.renders = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    async def get_map(self, key):
+        """Return (etag, body) for a request key from the cache, an in-flight render or a new one"""
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry
+
+        pending = self.in_flight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        if len(self.in_flight) >= self.max_pending:
+            self.rejected += 1
+            raise OverflowError("render queue is full")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.in_flight[key] = future
+        try:
+            body = await loop.run_in_executor(self.executor, render_key, key, self.tile_source)
+            self.renders += 1
+            entry = (f'"{hashlib.sha1(body).hexdigest()}"', body)
+            self.cache.put(key, *entry)
+            future.set_result(entry)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[key]
+        return entry
+
+    def stats(self):
+        return (f"renders {self.renders}\ncoalesced {self.coalesced}\nrejected {self.rejected}\n"
+                f"in_flight {len(self.in_flight)}\ncache_entries {len(self.cache)}\n"
+                f"cache_bytes {self.cache.size}\ncache_hits {self.cache.hits}\n"
+                f"cache_misses {self.cache.misses}\n")
+
+    async def respond(self, method, target, headers):
+        """Return (status, extra headers, body) for one request"""
+        if method not in ('GET', 'HEAD'):
+            return 405, {'Allow': 'GET, HEAD'}, b''
+        url = urlsplit(target)
+        if url.path == '/healthz':
+            return 200, {'Content-Type': 'text/plain'}, b'ok\n'
+        if url.path == '/stats':
+            return 200, {'Content-Type': 'text/plain'}, self.stats().encode()
+        if url.path != '/map':
+            return 404, {'Content-Type': 'text/plain'}, b'not found\n'
+
+        try:
+            key = parse_map_query(url.query)
+        except ValueError as e:
+            return 400, {'Content-Type': 'text/plain'}, f'{e}\n'.encode()
+
+        try:
+            etag, body = await self.get_map(key)
+        except OverflowError:
+            return 503, {'Content-Type': 'text/plain', 'Retry-After': '1'}, b'busy\n'
+        except Exception as e:
+            print(f"Render failed for {key}: {e!r}")
+            return 500, {'Content-Type': 'text/plain'}, b'render failed\n'
+
+        cache_headers = {'ETag': etag, 'Cache-Control': 'public, max-age=3600'}
+        if etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+            return 304, cache_headers, b''
+        return 200, dict(cache_headers, **{'Content-Type': CONTENT_TYPES[key[6]]}), body
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection until it is closed"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                start = time.perf_counter()
+                status, extra, body = await self.respond(method, target, headers)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+                response = [f'HTTP/1.1 {status} {REASONS[status]}']
+                for name, value in extra.items():
+                    response.append(f'{name}: {value}')
+                response.append(f'Content-Length: {len(body)}')
+                response.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+                writer.write(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1'))
+                if method != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+                print(f"{method} {target} {status} {len(body)}B {(time.perf_counter() - start) * 1000:.1f}ms")
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving maps on http://{host}:{port}/map ({self.tile_source} tiles)")
+        async with server:
+            await server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve rendered static maps over HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=2, help='render processes')
+    parser.add_argument('--max-pending', type=int, default=32, help='distinct renders queued before 503')
+    parser.add_argument('--cache-mb', type=float, default=64, help='response cache budget')
+    parser.add_argument('--tile-source', default='stand-in',
+                        help="'stand-in', 'osm', or an .mbtiles/.pmtiles archive")
+    args = parser.parse_args()
+
+    service = MapService(workers=args.workers, max_pending=args.max_pending,
+                         cache_bytes=int(args.cache_mb * 1024 * 1024), tile_source=args.tile_source)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.executor.shutdown(cancel_futures=True)
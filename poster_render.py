@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Render very large (poster-size) OpenStreetMap images in horizontal strips
+
+create_static_map_image builds the whole canvas in memory and then hands it
+to matplotlib, which is fine for 800x600 but needs gigabytes for a
+20000x15000 print poster. Here only the tile rows that overlap the current
+strip are fetched, the strip is drawn, and its rows are streamed straight
+into a PNG encoder, so peak memory is bounded by the strip size.
+"""
+
+import argparse
+import math
+import os
+import struct
+import zlib
+import numpy as np
+from PIL import Image, ImageDraw
+
+from tiles import TILE_SIZE, lat_lon_to_pixel, download_tile, get_tile
+from tile_synthesis import TileSynthesizer
+from feature_store import FeatureStore, as_feature_store
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+class StreamingPNGWriter:
+    """Write an 8-bit RGB PNG row by row without holding the whole image
+
+    Rows go to a temporary file that replaces path only when close() completes
+    the image, so an interrupted render never leaves a truncated PNG behind.
+    """
+
+    def __init__(self, path, width, height, compress_level=6, chunk_size=1 << 20):
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.chunk_size = chunk_size
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = []
+        self._pending_size = 0
+        self.path = path
+        self._tmp_path = f'{path}.{os.getpid()}.tmp'
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(PNG_SIGNATURE)
+        # Bit depth 8, colour type 2 (RGB), deflate, adaptive filtering, no interlace
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def _write_chunk(self, kind, data):
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(kind)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind)) & 0xffffffff))
+
+    def _emit(self, data, flush=False):
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+        if self._pending_size >= self.chunk_size or (flush and self._pending_size):
+            self._write_chunk(b'IDAT', b''.join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def write_strip(self, strip):
+        """Append the rows of an RGB image whose width matches the output"""
+        if strip.mode != 'RGB':
+            strip = strip.convert('RGB')
+        if strip.width != self.width:
+            raise ValueError(f"Strip width {strip.width} does not match image width {self.width}")
+        if self.rows_written + strip.height > self.height:
+            raise ValueError("More rows written than the image height")
+        raw = strip.tobytes()
+        stride = self.width * 3
+        # Filter type 0 (None) on every row keeps encoding a single cheap pass
+        rows = b''.join(b'\x00' + raw[i:i + stride] for i in range(0, len(raw), stride))
+        self._emit(self._compressor.compress(rows))
+        self.rows_written += strip.height
+
+    def close(self):
+        """Finish the zlib stream and the PNG file"""
+        if self.rows_written != self.height:
+            self.abort()
+            raise ValueError(f"Only {self.rows_written} of {self.height} rows were written")
+        self._emit(self._compressor.flush(), flush=True)
+        self._write_chunk(b'IEND', b'')
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """Discard the partial image"""
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def render_poster(lat, lon, zoom, width, height, filename, markers=None, strip_height=512,
+                  tile_dir='tiles', offline=False, synthesizer=None, marker_radius=10):
+    """Render a width x height map centred on lat/lon into a PNG, one strip at a time"""
+    if synthesizer is None and tile_dir:
+        synthesizer = TileSynthesizer(tile_dir)
+    fetch = None if offline else download_tile
+
+    # Global pixel position of the top-left corner of the output
+    center_x, center_y = lat_lon_to_pixel(lat, lon, zoom)
+    left = int(round(center_x - width / 2))
+    top = int(round(center_y - height / 2))
+
+    # Marker positions in output pixels, sorted by row so each strip finds its own markers by bisection
+    markers = as_feature_store(markers) or FeatureStore(())
+    marker_x, marker_y = markers.pixels(zoom)
+    order = np.argsort(marker_y, kind='stable')
+    marker_x = marker_x[order] - left
+    marker_y = marker_y[order] - top
+    marker_labels = markers.label_ids[order]
+
+    tx_min = left // TILE_SIZE
+    tx_max = (left + width - 1) // TILE_SIZE
+    # Tile rows are kept only while a strip still overlaps them
+    tile_rows = {}
+
+    with StreamingPNGWriter(filename, width, height) as writer:
+        for strip_top in range(0, height, strip_height):
+            h = min(strip_height, height - strip_top)
+            strip = Image.new('RGB', (width, h))
+            global_top = top + strip_top
+            ty_min = global_top // TILE_SIZE
+            ty_max = (global_top + h - 1) // TILE_SIZE
+
+            for ty in list(tile_rows):
+                if ty < ty_min:
+                    del tile_rows[ty]
+
+            for ty in range(ty_min, ty_max + 1):
+                if ty not in tile_rows:
+                    tile_rows[ty] = [
+                        get_tile(zoom, tx, ty, tile_dir=tile_dir, fetch=fetch, synthesizer=synthesizer)
+                        for tx in range(tx_min, tx_max + 1)
+                    ]
+                for i, tile in enumerate(tile_rows[ty]):
+                    strip.paste(tile, ((tx_min + i) * TILE_SIZE - left, ty * TILE_SIZE - global_top))
+
+            # Draw markers that reach into this strip
+            draw = ImageDraw.Draw(strip)
+            first = np.searchsorted(marker_y, strip_top - marker_radius)
+            last = np.searchsorted(marker_y, strip_top + h + marker_radius + 20)
+            for x, y, label_id in zip(marker_x[first:last].tolist(), marker_y[first:last].tolist(),
+                                      marker_labels[first:last].tolist()):
+                sy = y - strip_top
+                draw.ellipse([x - marker_radius, sy - marker_radius, x + marker_radius, sy + marker_radius],
+                             fill='red', outline='darkred', width=2)
+                label = markers.strings[label_id]
+                if label is not None:
+                    bbox = draw.textbbox((0, 0), label)
+                    draw.text((x - (bbox[2] - bbox[0]) // 2, sy - marker_radius - 4 - (bbox[3] - bbox[1])),
+                              label, fill='black')
+
+            writer.write_strip(strip)
+            print(f"Rendered rows {strip_top}-{strip_top + h} of {height}")
+
+    print(f"Created: {filename}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render a poster-size OpenStreetMap PNG in strips')
+    parser.add_argument('lat', type=float)
+    parser.add_argument('lon', type=float)
+    parser.add_argument('zoom', type=int)
+    parser.add_argument('--width', type=int, default=20000)
+    parser.add_argument('--height', type=int, default=15000)
+    parser.add_argument('--strip-height', type=int, default=512)
+    parser.add_argument('--tile-dir', default='tiles')
+    parser.add_argument('--offline', action='store_true')
+    parser.add_argument('--output', default='images/poster.png')
+    parser.add_argument('--markers', help='feature store file (see feature_store.py) with the markers to draw')
+    args = parser.parse_args()
+
+    if max(args.width, args.height) > TILE_SIZE * 2 ** args.zoom:
+        print(f"Warning: the poster is wider than the world at zoom {args.zoom}; "
+              f"try zoom {math.ceil(math.log2(max(args.width, args.height) / TILE_SIZE))} or higher")
+    render_poster(args.lat, args.lon, args.zoom, args.width, args.height, args.output,
+                  markers=FeatureStore.open(args.markers) if args.markers else None,
+                  strip_height=args.strip_height, tile_dir=args.tile_dir, offline=args.offline)
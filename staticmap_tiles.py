@@ -0,0 +1,91 @@
+"""
+staticmap.StaticMap drawing its base layer through the project's tile pipeline
+
+StaticMap formats url_template for every tile and hands the URL to its
+get() method, which downloads it - with no cache, no limit and no fallback.
+PipelineStaticMap uses a 'tile://' URL template and answers get() from
+tiles.get_tile instead, so staticmap maps share the tiles/ cache, the
+in-flight download sharing, the download limit, the synthesis and blank
+fallbacks and the TILE_STATS counters with generate_osm_maps.py. A tile
+fetched by either renderer is fetched once per batch, and cached tiles are
+handed to staticmap as the bytes of their PNG files.
+
+The fetch function can be any fetch(zoom, x, y), so the same class also
+draws from a local archive (tile_sources.py) or from stand-in tiles.
+"""
+
+import io
+import re
+import staticmap
+
+from tiles import TILE_DIR, count_tile, download_tile, get_tile, provider_tile_dir, tile_path
+from tile_synthesis import TileSynthesizer
+
+TILE_URL_TEMPLATE = 'tile://{z}/{x}/{y}'
+_TILE_URL = re.compile(r'^tile://(\d+)/(\d+)/(\d+)$')
+# Tiles that are not cached files are encoded as PNG for staticmap, which decodes them straight away
+PNG_COMPRESS_LEVEL = 1
+# A complete PNG file starts with the signature and ends with an empty IEND chunk
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_IEND = b'\x00\x00\x00\x00IEND\xaeB`\x82'
+
+class PipelineStaticMap(staticmap.StaticMap):
+    """StaticMap whose tiles come from tiles.get_tile instead of its own HTTP requests"""
+
+    def __init__(self, width, height, tile_dir=TILE_DIR, fetch=download_tile, synthesizer=None, **kwargs):
+        kwargs['url_template'] = TILE_URL_TEMPLATE
+        super().__init__(width, height, **kwargs)
+        self.tile_dir = tile_dir
+        self.fetch = fetch
+        if synthesizer is None and tile_dir:
+            synthesizer = TileSynthesizer(tile_dir)
+        self.synthesizer = synthesizer
+
+    def get(self, url, **kwargs):
+        match = _TILE_URL.match(url)
+        if match is None:
+            return super().get(url, **kwargs)
+        zoom, x, y = map(int, match.groups())
+        data = self._cached_bytes(zoom, x, y)
+        if data is not None:
+            count_tile('cache')
+            return 200, data
+        # get_tile always returns an image (blank as a last resort), so staticmap never retries
+        img = get_tile(zoom, x, y, tile_dir=self.tile_dir, fetch=self.fetch, synthesizer=self.synthesizer)
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+        return 200, buffer.getvalue()
+
+    def _cached_bytes(self, zoom, x, y):
+        """The cached PNG file of a tile as it is, saving a decode and re-encode
+
+        None if it is not cached, or if the file is not a complete PNG; like
+        load_tile, get_tile then treats it as missing.
+        """
+        n = 2 ** zoom
+        if not self.tile_dir or not 0 <= y < n:
+            return None
+        try:
+            with open(tile_path(self.tile_dir, zoom, x % n, y), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data.startswith(PNG_SIGNATURE) or not data.endswith(PNG_IEND):
+            return None
+        return data
+
+def static_map(width, height, tile_source=None, tile_dir=TILE_DIR, offline=False, **kwargs):
+    """A PipelineStaticMap over the tile cache, reading from tile_source (a TileSource) when given
+
+    Archive tiles are local already, so they are not copied into the tile cache;
+    tiles of an HTTP source are cached in a directory of their own.
+    offline=True never downloads: it draws archive, cached, synthesized or blank tiles.
+    """
+    if tile_source is None:
+        fetch = None if offline else download_tile
+    elif tile_source.is_local:
+        fetch, tile_dir = tile_source.fetch_factory(), None
+    else:
+        fetch = None if offline else tile_source.fetch_factory()
+        tile_dir = provider_tile_dir(tile_dir, tile_source.url)
+    return PipelineStaticMap(width, height, tile_dir=tile_dir, fetch=fetch, **kwargs)
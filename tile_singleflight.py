@@ -0,0 +1,119 @@
+"""
+Share one tile download among concurrent requesters
+
+- SingleFlight: within a process, the first thread asking for a key runs the
+  fetch and every thread that asks for the same key meanwhile waits for and
+  shares that result.
+- LockFile: across processes sharing a tile directory, an O_EXCL lock file
+  next to the tile marks who is downloading it; the others wait for the
+  tile file to appear instead of downloading it again.
+"""
+
+import os
+import threading
+import time
+import uuid
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Run fn() at most once at a time per key; concurrent callers share the outcome"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+class LockFile:
+    """Advisory lock file created with O_EXCL, so it works on any shared filesystem"""
+
+    def __init__(self, path, stale_after=60.0):
+        """
+        path: lock file to create
+        stale_after: seconds after which a lock is assumed to belong to a dead process
+        """
+        self.path = path
+        self.stale_after = stale_after
+        self._token = None
+
+    def try_acquire(self):
+        """Take the lock if nobody holds it (or the holder looks dead); never blocks"""
+        for _ in range(2):
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._remove_if_stale():
+                    return False
+                continue
+            # Identifies this holder, so release() never removes a lock taken over by someone else
+            self._token = f'{os.getpid()} {uuid.uuid4().hex}'
+            with os.fdopen(fd, 'w') as f:
+                f.write(self._token)
+            return True
+        return False
+
+    def _remove_if_stale(self):
+        try:
+            age = time.time() - os.path.getmtime(self.path)
+        except FileNotFoundError:
+            # Released between our attempt and the check
+            return True
+        if age < self.stale_after:
+            return False
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def release(self):
+        """Remove the lock file if it is still ours (it is not if we ran past stale_after)"""
+        token, self._token = self._token, None
+        try:
+            with open(self.path) as f:
+                if f.read() != token:
+                    return
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def wait(self, timeout, done=None, poll=0.05):
+        """Wait until the lock is released or done() is true; return False on timeout"""
+        deadline = time.monotonic() + timeout
+        while os.path.exists(self.path):
+            if done is not None and done():
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+        return True
@@ -0,0 +1,323 @@
+"""
+Pluggable tile sources: HTTP tile servers and local single-file tile archives
+
+A TileSource returns the encoded bytes of tile (z, x, y) in the usual XYZ
+scheme, or None when it has no such tile. Its fetch_factory plugs into
+everything that already takes one (render_static_map, render_region, the map
+service) and staticmap_tiles.static_map plugs it into staticmap.
+
+- MBTilesSource reads an MBTiles file through SQLite (tile rows are stored
+  TMS-style, bottom-up, and flipped here).
+- PMTilesSource reads a PMTiles v3 archive through a read-only mmap: the
+  header, root directory and leaf directories are range reads decoded once
+  and kept in a bounded cache, tiles are single range reads.
+
+Archives are opened lazily and reopened after pickling, so a source can be
+handed to process-pool workers and each worker gets its own handle.
+"""
+
+import gzip
+import io
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import zlib
+from bisect import bisect_right
+from collections import OrderedDict
+from PIL import Image
+import requests
+
+from tiles import FETCH_SLOTS, HEADERS, TILE_URL, retina_suffix
+
+# Tile formats that can be drawn as raster images
+RASTER_FORMATS = ('png', 'jpg', 'jpeg', 'webp')
+
+class TileSource:
+    """Base class: tile bytes by (zoom, x, y), plus a fetch function for the tile helpers"""
+
+    # Tile format ('png', 'jpg', 'webp', 'pbf', ...), when the source knows it
+    format = None
+    # Local archives are read directly; remote sources belong behind the tile cache
+    is_local = True
+
+    def get_tile_data(self, zoom, x, y):
+        """Encoded tile bytes, or None if the source has no such tile"""
+        raise NotImplementedError
+
+    def fetch(self, zoom, x, y):
+        """fetch(zoom, x, y) as used by tiles.get_tile: a decoded RGB tile or None"""
+        # A tile that cannot be read or decoded is a missing tile, so get_tile falls back
+        try:
+            data = self.get_tile_data(zoom, x, y)
+            if data is None:
+                return None
+            return Image.open(io.BytesIO(data)).convert('RGB')
+        except (OSError, ValueError, EOFError, zlib.error):
+            return None
+
+    def fetch_factory(self, url=None, scale=1):
+        """Drop-in for tiles.http_fetch (the url is ignored; archives only hold one scale)"""
+        if scale != 1:
+            raise ValueError(f"{type(self).__name__} only provides normal-resolution tiles")
+        if self.format is not None and self.format not in RASTER_FORMATS:
+            raise ValueError(f"{type(self).__name__} holds {self.format!r} tiles, which cannot be drawn")
+        return self.fetch
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class HTTPTileSource(TileSource):
+    """Tiles from a {z}/{x}/{y} URL template"""
+
+    is_local = False
+
+    def __init__(self, url=TILE_URL, scale=1, timeout=10):
+        self.url = url
+        self.scale = scale
+        self.timeout = timeout
+        self.format = os.path.splitext(url.split('?')[0])[1].lstrip('.').lower() or None
+
+    def get_tile_data(self, zoom, x, y):
+        url = self.url.format(z=zoom, x=x, y=y, r=retina_suffix(self.scale))
+        try:
+            with FETCH_SLOTS:
+                response = requests.get(url, headers=HEADERS, timeout=self.timeout)
+        except requests.RequestException:
+            return None
+        return response.content if response.status_code == 200 else None
+
+    def fetch_factory(self, url=None, scale=1):
+        if scale != self.scale:
+            return HTTPTileSource(url or self.url, scale, self.timeout).fetch
+        return self.fetch
+
+class MBTilesSource(TileSource):
+    """Tiles from an MBTiles (SQLite) file, one read-only connection per thread"""
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self._local = threading.local()
+        self.metadata = dict(self._connection().execute('SELECT name, value FROM metadata'))
+        self.format = self.metadata.get('format', 'png').lower()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            uri = 'file:' + os.path.abspath(self.path) + '?mode=ro'
+            connection = self._local.connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        return connection
+
+    def get_tile_data(self, zoom, x, y):
+        # MBTiles rows count from the bottom (TMS)
+        row = self._connection().execute(
+            'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?',
+            (zoom, x, (1 << zoom) - 1 - y)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def __getstate__(self):
+        return {'path': self.path, 'metadata': self.metadata, 'format': self.format}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+# PMTiles v3: https://github.com/protomaps/PMTiles/blob/main/spec/v3/spec.md
+PMTILES_HEADER = struct.Struct('<7sB QQQQQQQQ QQQ BBBB BB iiii B ii')
+PMTILES_COMPRESSION = {0: None, 1: None, 2: 'gzip', 3: 'brotli', 4: 'zstd'}
+# Compressions _decompress can undo
+PMTILES_SUPPORTED_COMPRESSION = (None, 'gzip')
+PMTILES_TILE_TYPES = {0: None, 1: 'pbf', 2: 'png', 3: 'jpg', 4: 'webp', 5: 'avif'}
+
+def zxy_to_tile_id(zoom, x, y):
+    """PMTiles tile id: tiles of all lower zooms, then the Hilbert index of (x, y) at zoom"""
+    tile_id = ((1 << (2 * zoom)) - 1) // 3
+    for a in range(zoom - 1, -1, -1):
+        s = 1 << a
+        rx = s & x
+        ry = s & y
+        tile_id += ((3 * rx) ^ ry) << a
+        # Rotate the quadrant
+        if ry == 0:
+            if rx != 0:
+                x = s - 1 - x
+                y = s - 1 - y
+            x, y = y, x
+    return tile_id
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def _decompress(data, compression):
+    if compression is None:
+        return data
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    raise ValueError(f"PMTiles {compression} compression is not supported")
+
+def parse_pmtiles_directory(data):
+    """Decode a (decompressed) directory into parallel tile_id, run_length, length, offset lists"""
+    count, pos = _read_varint(data, 0)
+    columns = []
+    for _ in range(4):
+        column = []
+        for _ in range(count):
+            value, pos = _read_varint(data, pos)
+            column.append(value)
+        columns.append(column)
+    deltas, run_lengths, lengths, raw_offsets = columns
+    tile_ids = []
+    tile_id = 0
+    for delta in deltas:
+        tile_id += delta
+        tile_ids.append(tile_id)
+    offsets = []
+    for i, raw in enumerate(raw_offsets):
+        # 0 means "directly after the previous entry"
+        offsets.append(offsets[i - 1] + lengths[i - 1] if raw == 0 and i > 0 else raw - 1)
+    return tile_ids, run_lengths, lengths, offsets
+
+class PMTilesSource(TileSource):
+    """Tiles from a PMTiles v3 archive via mmap range reads and a cached directory index"""
+
+    def __init__(self, path, directory_cache=64):
+        self.path = path
+        self.directory_cache = directory_cache
+        self._mmap = None
+        self._directories = OrderedDict()
+        self._lock = threading.Lock()
+        fields = PMTILES_HEADER.unpack(self._read(0, PMTILES_HEADER.size))
+        magic, version = fields[0], fields[1]
+        if magic != b'PMTiles' or version != 3:
+            raise ValueError(f"{path} is not a PMTiles v3 archive")
+        (self.root_offset, self.root_length, self.metadata_offset, self.metadata_length,
+         self.leaf_offset, self.leaf_length, self.data_offset, self.data_length) = fields[2:10]
+        self.internal_compression = PMTILES_COMPRESSION.get(fields[14], fields[14])
+        self.tile_compression = PMTILES_COMPRESSION.get(fields[15], fields[15])
+        for compression in (self.internal_compression, self.tile_compression):
+            if compression not in PMTILES_SUPPORTED_COMPRESSION:
+                raise ValueError(f"{path} uses {compression} compression, which is not supported "
+                                 f"(only gzip or none)")
+        self.format = PMTILES_TILE_TYPES.get(fields[16])
+        self.min_zoom, self.max_zoom = fields[17], fields[18]
+
+    def _read(self, offset, length):
+        if self._mmap is None:
+            with open(self.path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap[offset:offset + length]
+
+    def _directory(self, offset, length):
+        """Decoded directory at a byte range, from a small LRU cache"""
+        key = (offset, length)
+        with self._lock:
+            directory = self._directories.get(key)
+            if directory is not None:
+                self._directories.move_to_end(key)
+                return directory
+        directory = parse_pmtiles_directory(_decompress(self._read(offset, length), self.internal_compression))
+        with self._lock:
+            self._directories[key] = directory
+            while len(self._directories) > self.directory_cache:
+                self._directories.popitem(last=False)
+        return directory
+
+    def get_tile_data(self, zoom, x, y):
+        if not self.min_zoom <= zoom <= self.max_zoom:
+            return None
+        tile_id = zxy_to_tile_id(zoom, x, y)
+        offset, length = self.root_offset, self.root_length
+        # The root directory plus at most three levels of leaves
+        for _ in range(4):
+            tile_ids, run_lengths, lengths, offsets = self._directory(offset, length)
+            i = bisect_right(tile_ids, tile_id) - 1
+            if i < 0:
+                return None
+            if run_lengths[i] == 0:
+                # Leaf directory covering tile_ids[i] onwards
+                offset, length = self.leaf_offset + offsets[i], lengths[i]
+                continue
+            if tile_id >= tile_ids[i] + run_lengths[i]:
+                return None
+            data = self._read(self.data_offset + offsets[i], lengths[i])
+            return _decompress(data, self.tile_compression)
+        return None
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_mmap'] = None
+        state['_directories'] = OrderedDict()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+def open_tile_source(location):
+    """Tile source for an .mbtiles / .pmtiles path or an http(s) URL template"""
+    if location.startswith(('http://', 'https://')):
+        return HTTPTileSource(location)
+    extension = os.path.splitext(location)[1].lower()
+    if extension == '.mbtiles':
+        return MBTilesSource(location)
+    if extension == '.pmtiles':
+        return PMTilesSource(location)
+    raise ValueError(f"Unknown tile source {location!r}, expected an .mbtiles or .pmtiles file or a URL")
+
+def pack_mbtiles(tile_dir, path, name='tiles'):
+    """Pack a {z}/{x}/{y}.png tile directory (like the tiles/ cache) into an MBTiles file"""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    connection = sqlite3.connect(tmp_path)
+    with connection:
+        connection.execute('CREATE TABLE metadata (name TEXT, value TEXT)')
+        connection.execute('CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, '
+                           'tile_data BLOB)')
+        connection.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)')
+        connection.executemany('INSERT INTO metadata VALUES (?, ?)',
+                               [('name', name), ('format', 'png'), ('type', 'baselayer'), ('version', '1.1')])
+        count = 0
+        for root, _, files in os.walk(tile_dir):
+            parts = os.path.relpath(root, tile_dir).split(os.sep)
+            if len(parts) != 2 or not all(p.isdigit() for p in parts):
+                continue
+            zoom, x = int(parts[0]), int(parts[1])
+            for filename in files:
+                stem, extension = os.path.splitext(filename)
+                # Only normal-resolution tiles; skip @2x variants and temporary files
+                if extension != '.png' or not stem.isdigit():
+                    continue
+                with open(os.path.join(root, filename), 'rb') as f:
+                    connection.execute('INSERT INTO tiles VALUES (?, ?, ?, ?)',
+                                       (zoom, x, (1 << zoom) - 1 - int(stem), f.read()))
+                count += 1
+    connection.close()
+    os.replace(tmp_path, path)
+    return count
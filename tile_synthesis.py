@@ -0,0 +1,93 @@
+"""
+Synthesize stand-in tiles from tiles that are already on disk
+
+When a tile (z, x, y) is missing, a usable replacement can often be built
+without any network access:
+
+- underzoom: downsample and mosaic the cached children at z+1 (or deeper)
+- overzoom: upscale the matching quadrant of the nearest cached ancestor
+"""
+
+import os
+from PIL import Image
+
+from tiles import TILE_SIZE, load_tile, save_tile
+
+RESAMPLING = {
+    'nearest': Image.NEAREST,
+    'bilinear': Image.BILINEAR,
+    'bicubic': Image.BICUBIC,
+    'lanczos': Image.LANCZOS,
+}
+
+class TileSynthesizer:
+    """Build stand-in tiles from cached ancestors or descendants in a tile directory"""
+
+    def __init__(self, tile_dir, max_overzoom=4, max_underzoom=1, resampling='bilinear', cache=False):
+        """
+        tile_dir: {z}/{x}/{y}.png directory to read cached tiles from
+        max_overzoom: how many zoom levels up to look for an ancestor tile
+        max_underzoom: how many zoom levels down to look for a complete set of children
+        resampling: 'nearest', 'bilinear', 'bicubic' or 'lanczos'
+        cache: store synthesized tiles under tile_dir/_synth for reuse
+        """
+        if resampling not in RESAMPLING:
+            raise ValueError(f"Unknown resampling {resampling!r}, expected one of {sorted(RESAMPLING)}")
+        self.tile_dir = tile_dir
+        self.max_overzoom = max_overzoom
+        self.max_underzoom = max_underzoom
+        self.resampling = RESAMPLING[resampling]
+        self.cache = cache
+        # Synthesized tiles live apart from real ones so they never mask a later download
+        self.synth_dir = os.path.join(tile_dir, '_synth')
+
+    def synthesize(self, zoom, x, y):
+        """Return a stand-in tile for (zoom, x, y), or None if nothing usable is cached"""
+        if self.cache:
+            img = load_tile(self.synth_dir, zoom, x, y)
+            if img is not None:
+                return img
+
+        # Children carry real detail, so prefer them over a blurry upscale
+        img = self.from_children(zoom, x, y)
+        if img is None:
+            img = self.from_ancestor(zoom, x, y)
+
+        if img is not None and self.cache:
+            save_tile(self.synth_dir, zoom, x, y, img)
+        return img
+
+    def from_ancestor(self, zoom, x, y):
+        """Upscale the quadrant of the nearest cached ancestor that covers this tile"""
+        for depth in range(1, min(self.max_overzoom, zoom) + 1):
+            # Size of this tile's footprint inside the ancestor, in ancestor pixels
+            size = TILE_SIZE >> depth
+            if size == 0:
+                break
+            parent = load_tile(self.tile_dir, zoom - depth, x >> depth, y >> depth)
+            if parent is None:
+                continue
+            left = (x - ((x >> depth) << depth)) * size
+            top = (y - ((y >> depth) << depth)) * size
+            quadrant = parent.crop((left, top, left + size, top + size))
+            return quadrant.resize((TILE_SIZE, TILE_SIZE), self.resampling)
+        return None
+
+    def from_children(self, zoom, x, y):
+        """Downsample a complete set of cached descendants into one tile"""
+        for depth in range(1, self.max_underzoom + 1):
+            count = 1 << depth
+            mosaic = Image.new('RGB', (TILE_SIZE * count, TILE_SIZE * count))
+            complete = True
+            for dy in range(count):
+                for dx in range(count):
+                    child = load_tile(self.tile_dir, zoom + depth, (x << depth) + dx, (y << depth) + dy)
+                    if child is None:
+                        complete = False
+                        break
+                    mosaic.paste(child, (dx * TILE_SIZE, dy * TILE_SIZE))
+                if not complete:
+                    break
+            if complete:
+                return mosaic.resize((TILE_SIZE, TILE_SIZE), self.resampling, reducing_gap=2.0)
+        return None
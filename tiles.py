@@ -0,0 +1,239 @@
+"""
+Shared OpenStreetMap tile helpers: tile math, downloading and an on-disk tile cache
+
+get_tile is the project's one tile pipeline: tile cache, shared downloads,
+a limit on concurrent downloads, synthesis and blank-tile fallbacks, with
+counters in TILE_STATS. Both renderers draw through it (staticmap via
+staticmap_tiles.PipelineStaticMap), so a batch fetches each tile once.
+"""
+
+import hashlib
+import io
+import math
+import os
+import threading
+from collections import Counter
+from functools import partial
+from PIL import Image, ImageDraw
+import requests
+
+from tile_singleflight import LockFile, SingleFlight
+
+TILE_SIZE = 256
+# URL templates may also contain {r}, replaced with '@2x' etc. by providers with high-DPI tiles
+TILE_URL = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+BLANK_COLOR = '#f0f0f0'
+# Tile cache shared by the renderers, so a batch downloads each tile once
+TILE_DIR = 'tiles'
+# Seconds before a download lock left by another process is considered abandoned
+LOCK_STALE_AFTER = 30.0
+
+# HTTP downloads running at once per process (the OSM tile usage policy asks for at most 2);
+# local archive and stand-in reads are not limited
+MAX_CONCURRENT_FETCHES = 2
+
+# Process-wide coordination of concurrent downloads of the same tile
+TILE_FLIGHTS = SingleFlight()
+FETCH_SLOTS = threading.BoundedSemaphore(MAX_CONCURRENT_FETCHES)
+
+# Where get_tile's tiles came from: cache, fetched, fetch_failed, synthesized, blank
+TILE_STATS = Counter()
+_stats_lock = threading.Lock()
+
+def count_tile(outcome):
+    with _stats_lock:
+        TILE_STATS[outcome] += 1
+
+def format_tile_stats():
+    """One-line summary of TILE_STATS, e.g. for the end of a batch"""
+    with _stats_lock:
+        stats = dict(TILE_STATS)
+    outcomes = ('cache', 'fetched', 'fetch_failed', 'synthesized', 'blank')
+    summary = ', '.join(f'{outcome} {stats.get(outcome, 0)}' for outcome in outcomes)
+    return f"tiles: {summary}; {TILE_FLIGHTS.shared} shared in-flight"
+
+def lat_lon_to_tile(lat, lon, zoom):
+    """Convert a latitude/longitude to the (x, y) tile containing it"""
+    lat_rad = math.radians(lat)
+    n = 2.0 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return x, y
+
+def tile_to_lat_lon(x, y, zoom):
+    """Convert tile coordinates to the latitude/longitude of the tile's top-left corner"""
+    n = 2.0 ** zoom
+    lon = x / n * 360.0 - 180.0
+    lat_rad = math.atan(math.sinh(math.pi * (1 - 2 * y / n)))
+    lat = math.degrees(lat_rad)
+    return lat, lon
+
+def lat_lon_to_pixel(lat, lon, zoom):
+    """Convert a latitude/longitude to global Web Mercator pixel coordinates at zoom"""
+    world = TILE_SIZE * 2.0 ** zoom
+    lat_rad = math.radians(lat)
+    x = (lon + 180.0) / 360.0 * world
+    y = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * world
+    return x, y
+
+def retina_suffix(scale):
+    """'' for normal tiles, '@2x' / '@3x' for high-DPI variants"""
+    return f'@{scale}x' if scale > 1 else ''
+
+def tile_path(tile_dir, zoom, x, y, scale=1):
+    """Path of a tile inside a {z}/{x}/{y}.png tile directory ({y}@2x.png for high-DPI tiles)"""
+    return os.path.join(tile_dir, str(zoom), str(x), f'{y}{retina_suffix(scale)}.png')
+
+def provider_tile_dir(tile_dir, tile_url=TILE_URL):
+    """Cache directory for a provider: tile_dir itself for OSM, a subdirectory per other URL template
+
+    The cache is keyed by {z}/{x}/{y} only, so tiles of different providers must not share a directory.
+    """
+    if not tile_dir or tile_url == TILE_URL:
+        return tile_dir
+    digest = hashlib.sha1(tile_url.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(tile_dir, f'_{digest}')
+
+def blank_tile(scale=1):
+    """Flat grey tile used when nothing better is available"""
+    return Image.new('RGB', (TILE_SIZE * scale, TILE_SIZE * scale), color=BLANK_COLOR)
+
+def load_tile(tile_dir, zoom, x, y, scale=1):
+    """Load a tile from the tile directory, or return None if it is not there"""
+    path = tile_path(tile_dir, zoom, x, y, scale)
+    if not os.path.exists(path):
+        return None
+    try:
+        with Image.open(path) as img:
+            return img.convert('RGB')
+    except (OSError, ValueError):
+        # Truncated or corrupt file - treat it as missing
+        return None
+
+def save_tile(tile_dir, zoom, x, y, img, scale=1):
+    """Write a tile into the tile directory (atomically, so readers never see half a file)"""
+    path = tile_path(tile_dir, zoom, x, y, scale)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    img.save(tmp_path, format='PNG')
+    os.replace(tmp_path, path)
+
+def download_tile(zoom, x, y, url=TILE_URL, scale=1):
+    """Download a tile (by default from tile.openstreetmap.org), or return None on failure"""
+    url = url.format(z=zoom, x=x, y=y, r=retina_suffix(scale))
+    try:
+        with FETCH_SLOTS:
+            response = requests.get(url, headers=HEADERS, timeout=10)
+        if response.status_code == 200:
+            return Image.open(io.BytesIO(response.content)).convert('RGB')
+    except Exception:
+        pass
+    return None
+
+def http_fetch(url=TILE_URL, scale=1):
+    """Return a fetch(zoom, x, y) function that downloads from a URL template"""
+    return partial(download_tile, url=url, scale=scale)
+
+def stand_in_fetch(url=None, scale=1):
+    """Return a fetch(zoom, x, y) function that draws stand-in tiles locally (url is ignored)"""
+    return partial(stand_in_tile, scale=scale)
+
+def stand_in_tile(zoom, x, y, scale=1):
+    """Deterministic locally drawn tile, used instead of the network for offline runs and benchmarks"""
+    size = TILE_SIZE * scale
+    shade = 200 + (x * 7 + y * 13 + zoom * 3) % 40
+    img = Image.new('RGB', (size, size), color=(shade, shade, 230))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, 0, size - 1, size - 1], outline='#999999', width=scale)
+    draw.text((8 * scale, 8 * scale), f'{zoom}/{x}/{y}', fill='#333333')
+    return img
+
+def _fetch_key(fetch):
+    """Identify what a fetch function downloads, so equal partials dedupe together"""
+    if isinstance(fetch, partial):
+        return (fetch.func, fetch.args, tuple(sorted(fetch.keywords.items())))
+    return fetch
+
+def fetch_tile_once(zoom, x, y, fetch, tile_dir=None, scale=1):
+    """Fetch a tile, sharing one download among concurrent requesters
+
+    Threads of this process asking for the same tile wait for the first one;
+    with a tile_dir, a lock file also makes other processes wait for it. The
+    fetched tile is saved into tile_dir.
+    """
+    key = (tile_dir, _fetch_key(fetch), zoom, x, y, scale)
+    return TILE_FLIGHTS.do(key, lambda: _fetch_tile_locked(zoom, x, y, fetch, tile_dir, scale))
+
+def _counted_fetch(fetch, zoom, x, y):
+    """Call fetch, counting the outcome (downloads take a FETCH_SLOTS slot themselves)"""
+    img = fetch(zoom, x, y)
+    count_tile('fetched' if img is not None else 'fetch_failed')
+    return img
+
+def _fetch_tile_locked(zoom, x, y, fetch, tile_dir, scale):
+    if not tile_dir:
+        return _counted_fetch(fetch, zoom, x, y)
+
+    path = tile_path(tile_dir, zoom, x, y, scale)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lock = LockFile(f'{path}.lock', stale_after=LOCK_STALE_AFTER)
+    for _ in range(3):
+        if lock.try_acquire():
+            try:
+                # Another process may have saved it while we were waiting
+                img = load_tile(tile_dir, zoom, x, y, scale)
+                if img is not None:
+                    count_tile('cache')
+                    return img
+                img = _counted_fetch(fetch, zoom, x, y)
+                if img is not None:
+                    save_tile(tile_dir, zoom, x, y, img, scale)
+                return img
+            finally:
+                lock.release()
+        lock.wait(LOCK_STALE_AFTER, done=lambda: os.path.exists(path))
+        img = load_tile(tile_dir, zoom, x, y, scale)
+        if img is not None:
+            # Downloaded by another process
+            count_tile('cache')
+            return img
+        # The other process failed; try to take over
+
+    # Lock contention never settled - fetch without coordination rather than give up
+    return _counted_fetch(fetch, zoom, x, y)
+
+def get_tile(zoom, x, y, tile_dir=None, fetch=download_tile, synthesizer=None, scale=1):
+    """Return a tile image from the cache, the network, local synthesis or a blank tile
+
+    fetch=None disables network access entirely (offline rendering). scale > 1
+    requests high-DPI tiles; fetch must then return TILE_SIZE * scale pixel tiles.
+    """
+    n = 2 ** zoom
+    if not 0 <= y < n:
+        # Above or below the Web Mercator world
+        count_tile('blank')
+        return blank_tile(scale)
+    # Wrap around the antimeridian
+    x = x % n
+
+    if tile_dir:
+        img = load_tile(tile_dir, zoom, x, y, scale)
+        if img is not None:
+            count_tile('cache')
+            return img
+
+    if fetch is not None:
+        img = fetch_tile_once(zoom, x, y, fetch, tile_dir, scale)
+        if img is not None:
+            return img
+
+    # The synthesizer only knows about normal-resolution tiles
+    if synthesizer is not None and scale == 1:
+        img = synthesizer.synthesize(zoom, x, y)
+        if img is not None:
+            count_tile('synthesized')
+            return img
+
+    count_tile('blank')
+    return blank_tile(scale)